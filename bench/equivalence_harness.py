@@ -0,0 +1,810 @@
+"""Differential equivalence harness for the report engines.
+
+Runs a reference engine (a frozen copy of the report logic from before it
+was optimized) alongside each optimized engine on generated datasets, and
+checks that every engine selects the same venues and
+produces the same rows, in the same order, for every market. Reports each
+stage's total time and its speedup over the reference. Readers that stream
+rows parse them during the extract stage, so compare read and extract
+together for those. Exits with a non-zero status on any mismatch.
+
+Datasets are generated from a seed, one per case, with the kinds of rows
+real exports contain: duplicate jobs, reused zone codes, padded market
+codes, addresses spelled differently, rows with no sessions and rows with
+invalid values. Report parameters are varied per case as well. A failing
+case can be rerun on its own with `--seed`. Small datasets are also
+generated with hypothesis, which shrinks any mismatch it finds to a minimal
+dataset and prints it. ZIP codes are drawn from a
+small centroid table (fixtures/zip_centroids.csv), which every engine uses
+for the saturation radius in place of the bundled one.
+
+To check a new engine, subclass `Engine` (or `PipelineEngine`) and add it
+to `ENGINES`. The reader alone is checked by `xlsx_reader_bench.py`.
+
+Usage:
+    python bench/equivalence_harness.py [--cases N] [--rows ROWS] [--examples N] [--seed SEED]
+    python bench/equivalence_harness.py FILE.xlsx [FILE.xlsx ...]
+"""
+import argparse
+import os
+import pickle
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import openpyxl
+from dateutil.relativedelta import relativedelta
+from hypothesis import HealthCheck, given, settings
+from hypothesis import strategies as st
+from venues import venue_report
+from venues.proximity import distance_miles, load_zip_centroids
+from venues.rejections import RejectionLedger
+from venues.report_context import ReportContext, ReportParameters
+from venues.shards import MarketShards, ShardWriter
+from venues.venue_report import expected_headers
+
+STAGES = ('read', 'extract', 'filter', 'sort', 'entries')
+
+CENTROIDS = load_zip_centroids(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'zip_centroids.csv'))
+
+
+@dataclass(frozen=True)
+class ReportParams:
+    """The parameters of one report run, as entered at the prompts.
+    """
+    cutoff_date: datetime
+    start_date: datetime
+    end_date: datetime
+    saturation_period: int = 16
+    saturation_radius: float = 0
+    prox_weeks: int = 2
+    min_rsvps: int = 16
+    min_ror: float = 0
+    num_venues: int = 20
+
+    def context(self, venue_records) -> ReportContext:
+        params = ReportParameters(
+            start_date=self.start_date, end_date=self.end_date,
+            saturation_period=self.saturation_period, prox_weeks=self.prox_weeks,
+            min_rsvps=self.min_rsvps, min_ror=self.min_ror, num_venues=self.num_venues,
+            saturation_radius=self.saturation_radius)
+        return ReportContext(venue_records, params, CENTROIDS)
+
+
+class Engine:
+    """A way of running a report. Each stage takes the result of the one
+    before it; the first takes the path of a workbook and the last returns,
+    by market, the `(venue key, row)` of each ranked venue in order.
+    """
+    name = ''
+
+    def read(self, file_path: str, params: ReportParams):
+        raise NotImplementedError
+
+    def extract(self, loaded, params: ReportParams):
+        raise NotImplementedError
+
+    def filter(self, extracted, params: ReportParams):
+        raise NotImplementedError
+
+    def sort(self, filtered, params: ReportParams):
+        raise NotImplementedError
+
+    def entries(self, ranked, params: ReportParams) -> dict[str, list[tuple]]:
+        raise NotImplementedError
+
+
+@dataclass(frozen=True)
+class ReferenceSession:
+    """A frozen copy of the original `SessionRecord`.
+    """
+    meal_type: str
+    day_of_week: str
+    datetime: datetime
+
+    @staticmethod
+    def from_entry(entry: dict) -> list['ReferenceSession']:
+        sessions = []
+        for day in (1, 2, 3):
+            for meal_type in ('Lunch', 'Dinner'):
+                try:
+                    date_and_time = datetime.combine(entry[f'{meal_type} {day} Date'], entry[f'{meal_type} {day} Time'])
+                except (ValueError, TypeError):
+                    continue
+                sessions.append(ReferenceSession(meal_type, entry[f'{meal_type} Day {day}'], date_and_time))
+
+        if len(sessions) == 0:
+            raise ValueError('No valid sessions found in entry.')
+        return sessions
+
+
+@dataclass(frozen=True)
+class ReferenceJob:
+    """A frozen copy of the original `JobRecord`, identified by the
+    `(Job#, year, week)` key.
+    """
+    id: int
+    user: str
+    week: int
+    mail_piece: str
+    month: str
+    year: int
+    num_sessions: int
+    sessions: list[ReferenceSession]
+    quantity: int
+    rvsps: int
+    rmi: int
+
+    @property
+    def key(self) -> tuple[int, int, int]:
+        return (self.id, self.year, self.week)
+
+    @property
+    def end_date(self) -> datetime:
+        latest_session = None
+        for session in self.sessions:
+            if latest_session is None or latest_session.datetime < session.datetime:
+                latest_session = session
+        return latest_session.datetime
+
+    @property
+    def session_type(self) -> str:
+        lunches = sum(session.meal_type == 'Lunch' for session in self.sessions)
+        return f'{lunches} Lunch {len(self.sessions) - lunches} Dinner'
+
+    @property
+    def ror(self) -> float:
+        if self.quantity == 0:
+            return 0
+        return round(100 * (self.rvsps + self.rmi) / self.quantity, 3)
+
+    @staticmethod
+    def from_entry(entry: dict) -> 'ReferenceJob':
+        return ReferenceJob(
+            int(entry['Job#']), entry['User'], int(entry['Week']), entry['Mail Piece'],
+            entry['Month'], int(entry['Year']), int(entry['# Sessions']),
+            ReferenceSession.from_entry(entry),
+            int(entry['Qty']), int(entry['RSVPs']), int(entry['RMI']))
+
+
+class ReferenceVenue:
+    """A frozen copy of the original `VenueRecord`'s fields and parsing,
+    identified by market, zone and the first number in its street.
+    """
+    def __init__(self, market: str, loc_num: int, zone: str, restaurant: str, street: str, city: str, state: str, zip: int):
+        self.market = market
+        self.loc_num = loc_num
+        self.zone = zone
+        self.restaurant = restaurant
+        self.street = street
+        self.city = city
+        self.state = state
+        self.zip = zip
+        self.job_records: list[ReferenceJob] = []
+        street_numbers = re.findall(r'[0-9]+', street)
+        if not street_numbers:
+            raise ValueError(f"The address '{street}' contains no number to use for hashing.")
+        self.key = (market, zone, street_numbers[0])
+
+    @staticmethod
+    def from_entry(entry: dict) -> 'ReferenceVenue':
+        def strip_field(field):
+            return field.strip() if field is not None else ''
+
+        new_venue = ReferenceVenue(
+            strip_field(entry['MKT']), int(entry['LOC#']), strip_field(entry['Zone']),
+            strip_field(entry['Restaurant']), strip_field(entry['St Address']),
+            strip_field(entry['City']), strip_field(entry['ST']), int(entry['ZIP']))
+        new_venue.add_job(ReferenceJob.from_entry(entry))
+        return new_venue
+
+    def add_job(self, job: ReferenceJob):
+        # A duplicate job keeps its first row
+        if all(other.key != job.key for other in self.job_records):
+            self.job_records.append(job)
+
+
+class ReferenceEngine(Engine):
+    """A frozen copy of the report logic from before it was optimized, kept
+    as the definition of a correct report. Rows are matched to venues by a
+    loop over all venues, each venue's metrics are recomputed (with
+    `relativedelta`) wherever they are used, and each row written loops over
+    all venues for its zone's last visit and visit count. Workbooks are
+    read with openpyxl, and rows are parsed into the `Reference*` records
+    rather than the program's own, so that record parsing and identity are
+    checked as well.
+
+    Two rules were settled after the original was written and are applied
+    here too: jobs are identified by their Job#, year and week (a duplicate
+    keeps its first row), and ties are broken by venue and job key rather than by set
+    iteration order, which varies between runs.
+
+    The saturation radius was added after the optimizations, so it is
+    checked here by comparing the distance between every pair of venues.
+    """
+    name = 'reference'
+
+    def read(self, file_path, params):
+        sheet = openpyxl.load_workbook(file_path, data_only=True).active
+        return (list(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))), sheet)
+
+    def extract(self, loaded, params):
+        headers, sheet = loaded
+        venue_records: list[ReferenceVenue] = []
+        for entry in sheet.iter_rows(min_row=2, values_only=True):
+            # If entry contains a date before cutoff date, don't evaluate
+            outdated = False
+            for val in entry:
+                try:
+                    if val < params.cutoff_date:
+                        outdated = True
+                        break
+                except TypeError:
+                    pass
+            if outdated:
+                continue
+
+            entry = dict(zip(headers, entry))
+            if entry['Job#'] is None:
+                continue
+
+            try:
+                new_venue = ReferenceVenue.from_entry(entry)
+                for existing_venue in venue_records:
+                    if existing_venue.key == new_venue.key:
+                        existing_venue.add_job(new_venue.job_records[0])
+                        break
+                else:
+                    venue_records.append(new_venue)
+            except (TypeError, ValueError):
+                pass
+
+        return sorted(venue_records, key=lambda venue: venue.key)
+
+    def filter(self, venue_records, params):
+        saturated_zones = {
+            (venue.market, venue.zone) for venue in venue_records
+            if self.jobs_within(venue, relativedelta(weeks=params.saturation_period), params.start_date)
+        }
+
+        saturating_venues = [
+            venue for venue in venue_records
+            if self.jobs_within(venue, relativedelta(weeks=params.saturation_period), params.start_date)
+        ]
+
+        filtered_data = [
+            venue for venue in venue_records
+            if ((venue.market, venue.zone) not in saturated_zones
+                and not any(self.is_nearby(venue, other, params) for other in saturating_venues)
+                and self.latest_job(venue).rvsps >= params.min_rsvps
+                and self.latest_job(venue).ror >= params.min_ror)
+        ]
+        return (venue_records, filtered_data)
+
+    def sort(self, filtered, params):
+        venue_records, filtered_data = filtered
+        proximal_venues = []
+        nonproximal_venues = []
+        for venue in filtered_data:
+            if self.around_time_last_year(venue, params.start_date, params.end_date, params.prox_weeks):
+                proximal_venues.append(venue)
+            else:
+                nonproximal_venues.append(venue)
+
+        proximal_venues.sort(key=lambda venue: self.latest_job(venue).ror, reverse=True)
+        nonproximal_venues.sort(key=lambda venue: self.latest_job(venue).ror, reverse=True)
+        return (venue_records, proximal_venues + nonproximal_venues)
+
+    def entries(self, ranked, params):
+        venue_records, sorted_data = ranked
+        entries = defaultdict(list)
+        for venue in sorted_data:
+            entries[venue.market].append((venue.key, self.to_entry(venue, venue_records, params)))
+        return dict(entries)
+
+    def to_entry(self, venue: ReferenceVenue, venue_records: list[ReferenceVenue], params: ReportParams) -> tuple:
+        qual_job = self.around_time_last_year(venue, params.start_date, params.end_date, params.prox_weeks)
+        qual_job_date = qual_job[0].datetime.strftime("%m/%d/%Y") if qual_job is not None else ''
+        qual_job_rsvps = qual_job[1].rvsps if qual_job is not None else ''
+        qual_job_ror = qual_job[1].ror if qual_job is not None else ''
+
+        last_zone_venue = venue
+        for other_venue in venue_records:
+            if (other_venue.zone == venue.zone
+                and other_venue.market == venue.market
+                and self.latest_job(other_venue).end_date > self.latest_job(last_zone_venue).end_date):
+                last_zone_venue = other_venue
+
+        # A venue within the radius is only preferred over the zone's if it
+        # is more recent; venues are in key order, so the lowest key wins ties
+        for other_venue in venue_records:
+            if (self.is_nearby(venue, other_venue, params)
+                and self.latest_job(other_venue).end_date > self.latest_job(last_zone_venue).end_date):
+                last_zone_venue = other_venue
+
+        num_zone_visits = 0
+        for other_venue in venue_records:
+            if other_venue.zone == venue.zone and other_venue.market == venue.market:
+                num_zone_visits += len(other_venue.job_records)
+
+        latest_job = self.latest_job(venue)
+        return (
+            latest_job.id, latest_job.user, venue.market, venue.loc_num, latest_job.week,
+            venue.zone,
+            self.latest_job(last_zone_venue).end_date.strftime("%m/%d/%Y"),
+            last_zone_venue.restaurant,
+            self.latest_job(last_zone_venue).ror,
+            venue.restaurant, venue.street, venue.city, venue.state, venue.zip, "Menu",
+            latest_job.quantity,
+            latest_job.sessions[-1].datetime.strftime("%m/%d/%Y"),
+            latest_job.num_sessions, latest_job.session_type,
+            latest_job.rvsps, latest_job.rmi, latest_job.ror,
+            qual_job_date, qual_job_rsvps, qual_job_ror,
+            num_zone_visits,
+            self.average_ror(venue),
+        )
+
+    @staticmethod
+    def latest_job(venue: ReferenceVenue) -> ReferenceJob:
+        latest_job = None
+        for job in sorted(venue.job_records, key=lambda job: job.key):
+            if latest_job is None or latest_job.end_date <= job.end_date:
+                latest_job = job
+        return latest_job
+
+    @staticmethod
+    def is_nearby(venue: ReferenceVenue, other: ReferenceVenue, params: ReportParams) -> bool:
+        if params.saturation_radius <= 0 or venue.market != other.market:
+            return False
+        if venue.zip not in CENTROIDS or other.zip not in CENTROIDS:
+            return False
+        return distance_miles(CENTROIDS[venue.zip], CENTROIDS[other.zip]) <= params.saturation_radius
+
+    @staticmethod
+    def jobs_within(venue: ReferenceVenue, time: relativedelta, ref_date: datetime) -> list[ReferenceJob]:
+        return [job for job in venue.job_records if job.end_date >= ref_date - time]
+
+    @staticmethod
+    def around_time_last_year(venue: ReferenceVenue, start_date: datetime, end_date: datetime, prox_weeks: int):
+        start_threshold = start_date - relativedelta(years=1) - relativedelta(weeks=prox_weeks)
+        end_threshold = end_date - relativedelta(years=1) + relativedelta(weeks=prox_weeks)
+        for job in sorted(venue.job_records, key=lambda job: job.key):
+            for session in job.sessions:
+                if start_threshold <= session.datetime <= end_threshold:
+                    return (session, job)
+        return None
+
+    @staticmethod
+    def average_ror(venue: ReferenceVenue) -> float:
+        total_rsvps_rmis = sum(job.rvsps + job.rmi for job in venue.job_records)
+        total_quantity = sum(job.quantity for job in venue.job_records)
+        if total_quantity == 0:
+            return 0
+        return round(100 * total_rsvps_rmis / total_quantity, 3)
+
+
+class PipelineEngine(Engine):
+    """The report pipeline as DataDirect runs it on data small enough to
+    report on in memory: the streaming reader, rows parsed on a worker
+    process (so venues are pickled on their way back, which reorders their
+    job sets) and folded with the cutoff date, then `ReportContext`,
+    `VenueAggregates` and the rest.
+    """
+    name = 'pipeline'
+
+    def read(self, file_path, params):
+        return venue_report._read_excel(file_path)
+
+    def extract(self, loaded, params):
+        headers, sheet = loaded
+        parsed_rows = list(venue_report._parse_rows(headers, sheet, params.cutoff_date, progress=False))
+        results = [[pickle.loads(pickle.dumps(parsed_rows))]]
+        return venue_report._fold_ingests(results, params.cutoff_date)[0]
+
+
+    def filter(self, venue_records, params):
+        context = params.context(venue_records)
+        return (venue_report._filter_data(venue_records, context), context)
+
+    def sort(self, filtered, params):
+        filtered_data, context = filtered
+        return (venue_report._sort_data(filtered_data, context), context)
+
+    def entries(self, ranked, params):
+        sorted_data, context = ranked
+        entries = defaultdict(list)
+        for venue in sorted_data:
+            entries[venue.market].append((venue.key, venue.to_entry(context)))
+        return dict(entries)
+
+
+class RecutoffEngine(PipelineEngine):
+    """The pipeline when the cutoff date entered differs from the one the
+    background load started with (see `_reextract()`). Rows are read from a
+    later cutoff, as if that load had already started, then the rows an
+    earlier cutoff adds are read, and both are folded with the actual
+    cutoff, which drops the rows outdated at it.
+    """
+    name = 'recutoff'
+
+    def extract(self, loaded, params):
+        headers, sheet = loaded
+        later_cutoff = params.cutoff_date + timedelta(days=60)
+        earlier_cutoff = params.cutoff_date - timedelta(days=60)
+        file_parts = [
+            list(venue_report._parse_rows(headers, sheet, later_cutoff, progress=False)),
+            list(venue_report._parse_rows(headers, sheet, earlier_cutoff, later_cutoff, progress=False)),
+        ]
+        results = [pickle.loads(pickle.dumps(file_parts))]
+        return venue_report._fold_ingests(results, params.cutoff_date)[0]
+
+class ShardedEngine(PipelineEngine):
+    """The pipeline used for large inputs: rows are partitioned by market
+    into spill files, and each market is extracted, ranked and written on
+    its own (in one process here, so that stages can be timed). As in
+    `_report_market()`, venues never leave the process that extracted them;
+    only rows are pickled, into the spill files.
+    """
+    name = 'sharded'
+
+    def read(self, file_path, params):
+        headers, sheet = venue_report._read_excel(file_path)
+        shards = MarketShards()
+        writer = ShardWriter(headers, shards.directory, '0')
+        for row in sheet.iter_rows(min_row=2, values_only=True):
+            writer.add(row)
+        shards.add(writer.close())
+        return shards
+
+    def extract(self, shards, params):
+        venues_by_market = {}
+        for market in shards.markets:
+            results = [
+                (venue_report._extract_data(shard.headers, shard, params.cutoff_date, progress=False), RejectionLedger())
+                for shard in shards.by_market[market]
+            ]
+            venues_by_market[market] = venue_report._merge_ingests(results)[0]
+        # The spill files are no longer needed once every market is extracted
+        shards._directory.cleanup()
+        return venues_by_market
+
+    def filter(self, venues_by_market, params):
+        return {
+            market: super(ShardedEngine, self).filter(venue_records, params)
+            for market, venue_records in venues_by_market.items()
+        }
+
+    def sort(self, filtered, params):
+        return {
+            market: super(ShardedEngine, self).sort(market_filtered, params)
+            for market, market_filtered in filtered.items()
+        }
+
+    def entries(self, ranked, params):
+        # Like in a full report, markets with no ranked venues are left out
+        return {
+            market: [(venue.key, venue.to_entry(context)) for venue in sorted_data]
+            for market, (sorted_data, context) in ranked.items()
+            if len(sorted_data) > 0
+        }
+
+
+ENGINES: list[Engine] = [PipelineEngine(), RecutoffEngine(), ShardedEngine()]
+
+
+def run(engine: Engine, file_path: str, params: ReportParams, timings: dict[str, float]) -> dict[str, list[tuple]]:
+    """Run every stage of `engine`, adding the time of each to `timings`.
+    """
+    result = file_path
+    for stage in STAGES:
+        start = time.perf_counter()
+        result = getattr(engine, stage)(result, params)
+        timings[stage] += time.perf_counter() - start
+    return result
+
+
+def compare(expected: dict[str, list[tuple]], actual: dict[str, list[tuple]]) -> list[str]:
+    """Returns a description of each difference between two engines' results.
+    """
+    differences = []
+    for market in sorted(expected.keys() | actual.keys(), key=str):
+        if market not in actual:
+            differences.append(f'market {market!r}: missing')
+            continue
+        if market not in expected:
+            differences.append(f'market {market!r}: unexpected')
+            continue
+
+        expected_keys = [key for key, _ in expected[market]]
+        actual_keys = [key for key, _ in actual[market]]
+        if set(expected_keys) != set(actual_keys):
+            differences.append(
+                f'market {market!r}: selected venues differ; '
+                f'missing {sorted(set(expected_keys) - set(actual_keys))}, '
+                f'unexpected {sorted(set(actual_keys) - set(expected_keys))}')
+        elif expected_keys != actual_keys:
+            position = next(i for i, (e, a) in enumerate(zip(expected_keys, actual_keys)) if e != a)
+            differences.append(f'market {market!r}: order differs from position {position}')
+        else:
+            for (key, expected_row), (_, actual_row) in zip(expected[market], actual[market]):
+                if expected_row != actual_row:
+                    differences.append(f'market {market!r}, venue {key}: row differs\n'
+                                       f'      expected: {expected_row}\n'
+                                       f'      actual:   {actual_row}')
+                    break
+    return differences
+
+
+# ===== dataset generation ===== #
+
+def generate_rows(rng: random.Random, num_rows: int) -> list[list]:
+    """Generate `num_rows` job rows in the expected layout, including the
+    malformed and duplicate rows that real exports contain.
+    """
+    markets = ('HOU', 'PDX', 'SEA', ' HOU', 'PDX ')
+    # Few zones and addresses, so that venues share zones and jobs share venues
+    zones = [f'G{n}' for n in range(100, 100 + rng.randint(2, 40))]
+    zip_codes = sorted(CENTROIDS)
+    street_numbers = [str(rng.randint(1, 9999)) for _ in range(rng.randint(5, 40))]
+    first_date = datetime(2023, 1, 1)
+
+    rows = []
+    for i in range(num_rows):
+        # Repeat an earlier job now and then (same Job#, week and year), or
+        # reuse its job number in another year
+        if rows and rng.random() < 0.05:
+            row = list(rng.choice(rows))
+            row[expected_headers.index('RSVPs')] = rng.randint(0, 60)
+            if rng.random() < 0.3:
+                row[expected_headers.index('Year')] = rng.choice((2023, 2024, 2025))
+            rows.append(row)
+            continue
+
+        street_number = rng.choice(street_numbers)
+        street = rng.choice((f'{street_number} Main St', f' {street_number} Main Street', f'Suite 4, {street_number} Elm'))
+        week = rng.randint(1, 52)
+        row = [
+            rng.choice((i, i, i, i, None, 'n/a')),               # Job#
+            rng.choice(('AB', 'CD', 'EF')),                      # User
+            rng.choice(markets) if rng.random() > 0.01 else None,
+            rng.randint(1, 999),                                 # LOC#
+            week,
+            rng.choice(zones),
+            f'Restaurant {street_number}',
+            street if rng.random() > 0.02 else 'Main St',
+            'City', 'TX',
+            rng.choice(zip_codes) if rng.random() > 0.05 else rng.choice((rng.randint(10000, 99999), 'TBD')),
+            'Menu', 'Jan', rng.choice((2023, 2024, 2025)),
+            rng.randint(1, 3),                                   # # Sessions
+            rng.choice((0, rng.randint(1000, 9000))) if rng.random() < 0.02 else rng.randint(1000, 9000),
+            rng.randint(0, 60) if rng.random() > 0.01 else 'n/a',
+            rng.randint(0, 10),
+        ]
+
+        # Some jobs have no sessions at all
+        num_sessions = rng.choice((0, 1, 2, 2, 3, 6)) if rng.random() < 0.05 else rng.randint(1, 3)
+        date = first_date + timedelta(days=rng.randint(0, 900))
+        for session in range(6):
+            if session < num_sessions:
+                session_date = date + timedelta(days=session // 2)
+                session_time = timedelta(hours=11, minutes=30) if session % 2 == 0 else timedelta(hours=18)
+                row += [session_date.strftime('%A'), session_date, (session_date + session_time).time()]
+            else:
+                row += [None, None, None]
+        rows.append(row)
+
+    return rows
+
+
+def write_workbook(file_path: str, rows: list[list]):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(expected_headers)
+    for row in rows:
+        sheet.append(row)
+
+    for column in ('Lunch 1 Date', 'Lunch 2 Date', 'Lunch 3 Date', 'Dinner 1 Date', 'Dinner 2 Date', 'Dinner 3 Date'):
+        for cell in sheet[openpyxl.utils.get_column_letter(expected_headers.index(column) + 1)][1:]:
+            cell.number_format = 'mm/dd/yy'
+
+    workbook.save(file_path)
+
+
+def generate_params(rng: random.Random) -> ReportParams:
+    start_date = datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 600))
+    return ReportParams(
+        cutoff_date=datetime(2023, 1, 1) + timedelta(days=rng.randint(0, 200)),
+        start_date=start_date,
+        end_date=start_date + timedelta(days=rng.randint(0, 90)),
+        saturation_period=rng.choice((0, rng.randint(1, 20))),
+        saturation_radius=rng.choice((0, 0, 1, 3, 10)),
+        prox_weeks=rng.randint(0, 4),
+        min_rsvps=rng.randint(0, 30),
+        min_ror=rng.choice((0, 0, 0.5, 1)))
+
+
+# ===== property-based datasets ===== #
+
+@st.composite
+def job_rows(draw) -> list[list]:
+    """Small datasets of job rows in the expected layout. Values are drawn
+    from few choices, so that rows often share venues, zones, jobs and dates
+    and ties are common.
+    """
+    zip_codes = sorted(CENTROIDS)
+
+    def sometimes(value, invalid: tuple):
+        # About one value in ten is one of `invalid`. Shrinking moves toward
+        # the valid value.
+        return draw(st.sampled_from(invalid)) if draw(st.integers(0, 9)) == 9 else value
+
+    rows = []
+    for _ in range(draw(st.integers(1, 20))):
+        # Repeat an earlier job, maybe with its job number in another year
+        if rows and draw(st.integers(0, 4)) == 4:
+            row = list(draw(st.sampled_from(rows)))
+            row[expected_headers.index('RSVPs')] = draw(st.integers(0, 60))
+            row[expected_headers.index('Year')] = draw(st.sampled_from((2023, 2024)))
+            rows.append(row)
+            continue
+
+        street_number = draw(st.integers(1, 5))
+        row = [
+            sometimes(draw(st.integers(0, 8)), (None, 'n/a')),                     # Job#
+            draw(st.sampled_from(('AB', 'CD'))),                                  # User
+            sometimes(draw(st.sampled_from(('HOU', 'PDX', ' HOU', 'PDX '))), (None,)),
+            draw(st.integers(1, 5)),                                              # LOC#
+            draw(st.integers(1, 3)),                                              # Week
+            draw(st.sampled_from(('G100', 'G101', 'G102'))),
+            f'Restaurant {street_number}',
+            sometimes(draw(st.sampled_from((f'{street_number} Main St', f' {street_number} Main Street'))), ('Main St',)),
+            'City', 'TX',
+            sometimes(draw(st.sampled_from(zip_codes)), (99999, 'TBD')),
+            'Menu', 'Jan', draw(st.sampled_from((2023, 2024))),
+            draw(st.integers(1, 3)),                                              # # Sessions
+            draw(st.integers(0, 3000)),                                           # Qty
+            sometimes(draw(st.integers(0, 60)), ('n/a',)),                        # RSVPs
+            draw(st.integers(0, 10)),                                             # RMI
+        ]
+
+        num_sessions = sometimes(draw(st.integers(1, 6)), (0,))
+        date = datetime(2023, 1, 1) + timedelta(days=draw(st.integers(0, 900)))
+        for session in range(6):
+            if session < num_sessions:
+                session_date = date + timedelta(days=session // 2)
+                session_time = timedelta(hours=11, minutes=30) if session % 2 == 0 else timedelta(hours=18)
+                row += [session_date.strftime('%A'), session_date, (session_date + session_time).time()]
+            else:
+                row += [None, None, None]
+        rows.append(row)
+
+    return rows
+
+
+@st.composite
+def report_params(draw) -> ReportParams:
+    start_date = datetime(2024, 1, 1) + timedelta(days=draw(st.integers(0, 600)))
+    return ReportParams(
+        cutoff_date=datetime(2023, 1, 1) + timedelta(days=draw(st.integers(0, 200))),
+        start_date=start_date,
+        end_date=start_date + timedelta(days=draw(st.integers(0, 90))),
+        saturation_period=draw(st.integers(0, 20)),
+        saturation_radius=draw(st.sampled_from((0, 1, 3, 10))),
+        prox_weeks=draw(st.integers(0, 4)),
+        min_rsvps=draw(st.integers(0, 30)),
+        min_ror=draw(st.sampled_from((0, 0.5, 1))))
+
+
+def check_properties(num_examples: int, temp_dir: str, reference: Engine) -> bool:
+    """Run every engine against `reference` on `num_examples` datasets from
+    hypothesis. Returns whether they all matched; if not, the minimal
+    failing dataset is printed. These runs aren't timed, as shrinking reruns
+    failing cases many times.
+    """
+    file_path = os.path.join(temp_dir, 'property.xlsx')
+    timings = defaultdict(float)
+
+    @settings(max_examples=num_examples, deadline=None, database=None, suppress_health_check=list(HealthCheck))
+    @given(rows=job_rows(), params=report_params())
+    def engines_match(rows: list[list], params: ReportParams):
+        write_workbook(file_path, rows)
+        expected = run(reference, file_path, params, timings)
+        for engine in ENGINES:
+            differences = compare(expected, run(engine, file_path, params, timings))
+            assert not differences, f'({engine.name}) ' + '\n  '.join(differences)
+
+    try:
+        engines_match()
+    except AssertionError as e:
+        print(f'  MISMATCH {e}')
+        # hypothesis attaches the falsifying example as notes
+        for note in getattr(e, '__notes__', ()):
+            print(f'  {note}')
+        return False
+
+    return True
+
+
+# ===== entry point ===== #
+
+def parse_date(value: str) -> datetime:
+    return datetime.strptime(value, '%m/%d/%y')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*', help='workbooks to run with the default report parameters')
+    parser.add_argument('--cases', type=int, default=20, help='number of generated datasets (default: 20)')
+    parser.add_argument('--rows', type=int, default=2000, help='maximum rows per generated dataset (default: 2000)')
+    parser.add_argument('--examples', type=int, default=50, help='number of hypothesis datasets (default: 50)')
+    parser.add_argument('--seed', type=int, help='run only the generated case with this seed')
+    parser.add_argument('--start', type=parse_date, help='scheduling period start for FILEs, as MM/DD/YY (default: today)')
+    parser.add_argument('--end', type=parse_date, help='scheduling period end for FILEs, as MM/DD/YY (default: a month after the start)')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.TemporaryDirectory()
+    cases: list[tuple[str, str, ReportParams]] = []
+    if args.files:
+        # The program's defaults, with the cutoff date relative to the
+        # scheduling period rather than to today
+        start_date = args.start or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date = args.end or start_date + relativedelta(months=1)
+        params = ReportParams(start_date - relativedelta(months=16), start_date, end_date)
+        cases = [(file_path, file_path, params) for file_path in args.files]
+    else:
+        seeds = [args.seed] if args.seed is not None else range(args.cases)
+        for seed in seeds:
+            rng = random.Random(seed)
+            file_path = os.path.join(temp_dir.name, f'case_{seed}.xlsx')
+            write_workbook(file_path, generate_rows(rng, rng.randint(1, args.rows)))
+            cases.append((f'seed {seed}', file_path, generate_params(rng)))
+
+    reference = ReferenceEngine()
+    timings = {engine.name: defaultdict(float) for engine in [reference] + ENGINES}
+    failures = 0
+    for label, file_path, params in cases:
+        expected = run(reference, file_path, params, timings[reference.name])
+        num_rows = sum(len(rows) for rows in expected.values())
+        print(f'{label}: {len(expected)} market(s), {num_rows} ranked venue(s)')
+
+        for engine in ENGINES:
+            differences = compare(expected, run(engine, file_path, params, timings[engine.name]))
+            for difference in differences:
+                print(f'  MISMATCH ({engine.name}) {difference}')
+            failures += len(differences) > 0
+
+    # Reruns of a single case or file skip the property-based datasets
+    if not args.files and args.seed is None and args.examples > 0:
+        print(f'{args.examples} hypothesis dataset(s)')
+        failures += not check_properties(args.examples, temp_dir.name, reference)
+
+    temp_dir.cleanup()
+
+    print(f'\nTotal time per stage over {len(cases)} case(s):')
+    print(f'  {"engine":<12}' + ''.join(f'{stage:>18}' for stage in STAGES + ('total',)))
+    for engine in [reference] + ENGINES:
+        timings[engine.name]['total'] = sum(timings[engine.name].values())
+        cells = []
+        for stage in STAGES + ('total',):
+            stage_time = timings[engine.name][stage]
+            speedup = timings[reference.name][stage] / stage_time if stage_time > 0 else float('inf')
+            cells.append(f'{stage_time:8.3f} s ({speedup:4.1f}x)')
+        print(f'  {engine.name:<12}' + ''.join(f'{cell:>18}' for cell in cells))
+
+    if failures > 0:
+        print(f'\n{failures} engine run(s) did not match the reference.')
+        return 1
+
+    print('\nAll engines match the reference.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
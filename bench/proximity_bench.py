@@ -0,0 +1,101 @@
+"""Correctness check and benchmark for the ZIP code proximity index.
+
+Places venues at random ZIP codes from the bundled centroid table, and for
+each radius checks that `ProximityIndex.within()` finds exactly the venues
+that a brute-force great-circle comparison against every venue finds.
+Reports the time to build the index and answer every venue's query, and
+the time the brute force takes for the venues it checks. Exits with a
+non-zero status on any mismatch.
+
+Each query measures the distance to every venue near it, so the time grows
+with the number of neighbors. Check radii much larger than the default
+ones with fewer venues (e.g., `--venues 5000 --radius 50 300`).
+
+Usage:
+    python bench/proximity_bench.py [--venues N] [--checked N] [--radius MILES ...]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from venues.proximity import ProximityIndex, distance_miles, load_zip_centroids
+from venues.records import VenueRecord
+
+
+def generate_venues(centroids: dict[int, tuple[float, float]], num_venues: int) -> list[VenueRecord]:
+    """Generate venues in two markets at random ZIP codes, a few of them not
+    in the centroid table.
+    """
+    rng = random.Random(0)
+    zip_codes = sorted(centroids)
+    # Venues of a market are clustered around a few ZIP codes, like real markets
+    hubs = {market: rng.sample(range(len(zip_codes)), 5) for market in ('HOU', 'PDX')}
+
+    venues = []
+    for i in range(num_venues):
+        market = rng.choice(('HOU', 'PDX'))
+        if rng.random() < 0.01:
+            zip_code = 99999
+        else:
+            hub = rng.choice(hubs[market])
+            zip_code = zip_codes[min(max(hub + rng.randint(-300, 300), 0), len(zip_codes) - 1)]
+        venues.append(VenueRecord(market, i, f'G{rng.randint(100, 150)}', f'Restaurant {i}',
+                                  f'{i} Main St', 'City', 'ST', zip_code))
+    return venues
+
+
+def brute_force(venue: VenueRecord, venues: list[VenueRecord], radius: float, centroids: dict) -> set[int]:
+    point = centroids.get(venue.zip)
+    if point is None:
+        return set()
+    return {
+        id(other) for other in venues
+        if other.market == venue.market and other.zip in centroids
+        and distance_miles(point, centroids[other.zip]) <= radius
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=30000, help='number of venues (default: 30000)')
+    parser.add_argument('--checked', type=int, default=500, help='venues checked against brute force (default: 500)')
+    parser.add_argument('--radius', type=float, nargs='+', default=[1, 5, 25], help='radii in miles (default: 1 5 25)')
+    args = parser.parse_args()
+
+    centroids = load_zip_centroids()
+    if not centroids:
+        print('The ZIP code centroid table is missing.')
+        return 1
+
+    venues = generate_venues(centroids, args.venues)
+    checked = venues[:args.checked]
+    all_match = True
+    print(f'{len(venues)} venues, {len(checked)} checked against brute force')
+
+    for radius in args.radius:
+        start = time.perf_counter()
+        index = ProximityIndex(venues, radius, centroids)
+        found = {id(venue): {id(other) for other in index.within(venue)} for venue in venues}
+        index_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = {id(venue): brute_force(venue, venues, radius, centroids) for venue in checked}
+        brute_time = time.perf_counter() - start
+
+        mismatches = sum(found[key] != expected[key] for key in expected)
+        neighbors = sum(len(found[id(venue)]) for venue in venues) / len(venues)
+        print(f'  {radius:6g} mi: index {index_time:7.3f} s for all venues, '
+              f'brute force {brute_time:7.3f} s for {len(checked)}; '
+              f'{neighbors:.1f} neighbors on average; '
+              + ('match' if mismatches == 0 else f'MISMATCH for {mismatches} venue(s)'))
+        all_match = all_match and mismatches == 0
+
+    return 0 if all_match else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
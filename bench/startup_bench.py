@@ -0,0 +1,108 @@
+"""Startup benchmark for DataDirect.
+
+Measures the time from interpreter launch until the modules imported by
+`data_direct.py` before its first prompt are loaded, and reports the
+slowest imports using `python -X importtime`. Exits with a non-zero status
+if the median launch time exceeds the target.
+
+Usage:
+    python bench/startup_bench.py [--runs N] [--target-ms MS] [--top N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Mirrors the imports data_direct.py performs before prompting the user.
+STARTUP_IMPORTS = 'import misc.ui; from venues import venue_report'
+
+# Modules that must not be loaded at startup.
+DEFERRED_MODULES = ('openpyxl', 'tqdm', 'dateutil', 'tkinter')
+
+
+def time_launch() -> float:
+    """Returns the wall time in milliseconds to launch a fresh interpreter
+    and perform the startup imports.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', STARTUP_IMPORTS], cwd=SRC_DIR, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def baseline_launch() -> float:
+    """Returns the wall time in milliseconds to launch a bare interpreter.
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], cwd=SRC_DIR, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def import_times() -> list[tuple[int, str]]:
+    """Returns `(cumulative_us, module)` pairs reported by `-X importtime`
+    for the startup imports, slowest first.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_IMPORTS],
+        cwd=SRC_DIR, check=True, capture_output=True, text=True)
+
+    times = []
+    for line in result.stderr.splitlines():
+        # Lines look like "import time:       123 |        456 | module"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times.append((int(cumulative), module.strip()))
+
+    times.sort(reverse=True)
+    return times
+
+
+def loaded_deferred_modules() -> list[str]:
+    """Returns the deferred modules that were loaded by the startup imports.
+    """
+    check = (f'{STARTUP_IMPORTS}; import sys; '
+             f'print(" ".join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))')
+    result = subprocess.run([sys.executable, '-c', check],
+                            cwd=SRC_DIR, check=True, capture_output=True, text=True)
+    return result.stdout.split()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='number of timed launches')
+    parser.add_argument('--target-ms', type=float, default=150, help='maximum median launch time')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to list')
+    args = parser.parse_args()
+
+    launches = [time_launch() for _ in range(args.runs)]
+    baselines = [baseline_launch() for _ in range(args.runs)]
+    median = statistics.median(launches)
+
+    print(f'Launch to prompt (median of {args.runs}): {median:.1f} ms')
+    print(f'Bare interpreter (median of {args.runs}): {statistics.median(baselines):.1f} ms')
+    print('\nSlowest imports (cumulative):')
+    for cumulative, module in import_times()[:args.top]:
+        print(f'{cumulative / 1000:10.1f} ms  {module}')
+
+    status = 0
+    loaded = loaded_deferred_modules()
+    if loaded:
+        print(f'\nFAIL: deferred modules loaded at startup: {", ".join(loaded)}')
+        status = 1
+
+    if median > args.target_ms:
+        print(f'\nFAIL: median launch time exceeds target of {args.target_ms:.0f} ms')
+        status = 1
+    elif status == 0:
+        print(f'\nOK: within target of {args.target_ms:.0f} ms')
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Correctness check and benchmark for the streaming xlsx reader.
+
+Reads each workbook with both openpyxl (the way DataDirect used to) and
+`misc.xlsx_reader`, checks that every row has the same values, and reports
+the time each took. Exits with a non-zero status on any mismatch.
+
+Usage:
+    python bench/xlsx_reader_bench.py FILE.xlsx [FILE.xlsx ...]
+    python bench/xlsx_reader_bench.py --generate ROWS
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import openpyxl
+from misc import xlsx_reader
+from venues.venue_report import expected_headers
+
+
+def read_openpyxl(file_path: str) -> list[tuple]:
+    workbook = openpyxl.load_workbook(file_path, data_only=True)
+    return list(workbook.active.iter_rows(values_only=True))
+
+
+def read_streaming(file_path: str) -> list[tuple]:
+    return list(xlsx_reader.open_sheet(file_path).iter_rows(values_only=True))
+
+
+def strip_row(row: tuple) -> tuple:
+    """Drop trailing empty cells, whose count depends on the sheet's width.
+    """
+    end = len(row)
+    while end > 0 and row[end - 1] is None:
+        end -= 1
+    return row[:end]
+
+
+def compare(file_path: str) -> bool:
+    """Compare both readers on a file and print their timings. Returns whether
+    the values matched.
+    """
+    start = time.perf_counter()
+    expected = read_openpyxl(file_path)
+    openpyxl_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = read_streaming(file_path)
+    streaming_time = time.perf_counter() - start
+
+    print(f'{file_path}: {len(expected)} rows')
+    print(f'  openpyxl:  {openpyxl_time:8.3f} s')
+    print(f'  streaming: {streaming_time:8.3f} s ({openpyxl_time / streaming_time:.1f}x faster)')
+
+    # openpyxl may report trailing empty rows that the file doesn't contain
+    while expected and not strip_row(expected[-1]):
+        expected.pop()
+    while actual and not strip_row(actual[-1]):
+        actual.pop()
+
+    if len(expected) != len(actual):
+        print(f'  MISMATCH: openpyxl read {len(expected)} rows, streaming read {len(actual)}')
+        return False
+
+    for row_num, (expected_row, actual_row) in enumerate(zip(expected, actual), start=1):
+        if strip_row(expected_row) != strip_row(actual_row):
+            print(f'  MISMATCH on row {row_num}:\n    openpyxl:  {expected_row}\n    streaming: {actual_row}')
+            return False
+
+    print('  values match')
+    return True
+
+
+def generate_workbook(file_path: str, num_rows: int):
+    """Write a workbook of `num_rows` random jobs in the expected layout.
+    """
+    rng = random.Random(0)
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(expected_headers)
+
+    for job_id in range(num_rows):
+        row = [job_id, rng.choice(('AB', 'CD', 'EF')), rng.choice(('HOU', 'PDX', 'SEA')),
+               rng.randint(1, 999), rng.randint(1, 52), f'G{rng.randint(100, 140)}',
+               f'Restaurant {rng.randint(1, 500)}', f'{rng.randint(1, 9999)} Main St',
+               'City', 'TX', rng.randint(10000, 99999), 'Menu', 'Jan', 2024,
+               2, rng.randint(1000, 9000), rng.randint(0, 60), rng.randint(0, 10)]
+        # Formulas are saved without a value until Excel calculates them
+        if rng.random() < 0.01:
+            row[expected_headers.index('RMI')] = '=2*3'
+
+        date = datetime(2023, 1, 1) + timedelta(days=rng.randint(0, 700))
+        for meal in range(6):
+            if meal < 2:
+                row += [date.strftime('%A'), date, (date + timedelta(hours=11, minutes=30)).time()]
+            else:
+                row += [None, None, None]
+        sheet.append(row)
+
+    for column in ('Lunch 1 Date', 'Lunch 2 Date'):
+        for cell in sheet[openpyxl.utils.get_column_letter(expected_headers.index(column) + 1)][1:]:
+            cell.number_format = 'mm/dd/yy'
+
+    # Number formats that only look like dates (escaped literals, padding and
+    # date codes past the first section), and one elapsed duration
+    number_formats = {
+        'Qty': '#,##0\\ \\p\\c\\s',
+        'RSVPs': '0_h',
+        'RMI': '0;[Red]-0 mm;"none"',
+        '# Sessions': '[h]:mm',
+    }
+    for column, number_format in number_formats.items():
+        for cell in sheet[openpyxl.utils.get_column_letter(expected_headers.index(column) + 1)][1:]:
+            cell.number_format = number_format
+
+    workbook.save(file_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='*', help='workbooks to compare')
+    parser.add_argument('--generate', type=int, metavar='ROWS', help='compare on a generated workbook of ROWS jobs')
+    args = parser.parse_args()
+
+    files = list(args.files)
+    temp_dir = None
+    if args.generate:
+        temp_dir = tempfile.TemporaryDirectory()
+        generated = os.path.join(temp_dir.name, 'generated.xlsx')
+        generate_workbook(generated, args.generate)
+        files.append(generated)
+
+    if not files:
+        parser.error('no workbooks given')
+
+    all_match = all([compare(file_path) for file_path in files])
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+    return 0 if all_match else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,27 @@
+# PyInstaller build of the single-file executable that setup_script.iss
+# packages (dist\data_direct.exe). Build from the repository root with:
+#
+#     pyinstaller data_direct.spec
+#
+# Data files are unpacked under sys._MEIPASS at the same relative path they
+# have under src, which is where the program looks for them.
+
+a = Analysis(
+    ['src/data_direct.py'],
+    pathex=['src'],
+    datas=[
+        ('src/venues/data/zip_centroids.csv', 'venues/data'),
+        ('src/venues/data/zip_centroids.LICENSE.txt', 'venues/data'),
+    ],
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    a.binaries,
+    a.datas,
+    [],
+    name='data_direct',
+    console=True,
+)
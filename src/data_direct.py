@@ -3,15 +3,26 @@ __version__ = "1.5.1"
 
 import traceback
 import misc.ui as ui
-from venues import venue_report
 
-ui.clear(__version__)
-print('[Begin Program]')
+# Reports are extracted in worker processes, which re-import this module,
+# so the program itself must only run in the main process.
+if __name__ == '__main__':
+    # Required for worker processes in the frozen executable
+    import multiprocessing
+    multiprocessing.freeze_support()
 
-try:
-    venue_report.generate()
-except Exception as e:
-    ui.print_error(f'An unexpected error occurred while generating the venue report: {e}')
-    traceback.print_exc()
-    ui.print_error('\nThis is a fatal error; the program will now exit. Press any key to continue.')
-    ui.pause()
\ No newline at end of file
+    ui.clear(__version__)
+
+    # Imported after the banner is shown so the user sees the program start
+    # right away. Heavy dependencies are imported lazily by the report itself.
+    from venues import venue_report
+
+    print('[Begin Program]')
+
+    try:
+        venue_report.generate()
+    except Exception as e:
+        ui.print_error(f'An unexpected error occurred while generating the venue report: {e}')
+        traceback.print_exc()
+        ui.print_error('\nThis is a fatal error; the program will now exit. Press any key to continue.')
+        ui.pause()
@@ -1,6 +1,4 @@
-import os, sys, msvcrt, time
-import tkinter
-import tkinter.filedialog
+import os, sys, time
 from datetime import datetime
 from misc import utils, ui
 
@@ -78,15 +76,18 @@ def query_date(msg: str, default: datetime=None) -> datetime:
         
     return resp
 
-def promptFile(filetypes) -> str:
+def promptFiles(filetypes) -> tuple[str]:
     """
-    Opens file explorer for the user to select a file and returns filepath.
+    Opens file explorer for the user to select one or more files and returns their filepaths.
     """
-    return tkinter.filedialog.askopenfilename(filetypes=filetypes)
+    # tkinter is slow to import, so wait until a dialog is actually needed.
+    import tkinter.filedialog
+    return tkinter.filedialog.askopenfilenames(filetypes=filetypes)
 
 def promptDirectory() -> str:
     """
     Opens file explorer for the user to select a filepath for saving a file to."""
+    import tkinter.filedialog
     return tkinter.filedialog.askdirectory()
 
 def hideCursor():
@@ -129,6 +130,7 @@ def pause(msg: str=None):
     if msg is not None:
         print(msg)
 
+    import msvcrt
     return msvcrt.getch()
 
 def exit():
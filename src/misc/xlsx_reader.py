@@ -0,0 +1,430 @@
+"""A fast, read-only reader for the values of a single .xlsx worksheet.
+
+openpyxl builds a Python object for every cell and resolves every style,
+even in read-only mode. This reader instead opens the xlsx zip directly and
+stream-parses the shared strings and worksheet XML, only looking at cell
+styles to tell which numbers are dates. Rows are yielded as plain value
+tuples matching what openpyxl's `iter_rows(values_only=True)` returns with
+`data_only=True`.
+"""
+import datetime
+import posixpath
+import re
+import zipfile
+from functools import lru_cache
+from xml.etree.ElementTree import iterparse, parse
+from xml.parsers import expat
+
+
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_ROW = _MAIN_NS + 'row'
+_CELL = _MAIN_NS + 'c'
+_TEXT = _MAIN_NS + 't'
+_RICH_RUN = _MAIN_NS + 'r'
+_SHARED_STRING = _MAIN_NS + 'si'
+_DIMENSION = _MAIN_NS + 'dimension'
+
+# Element names as reported by expat when parsing worksheets
+_X_ROW = _MAIN_NS[1:-1] + '|row'
+_X_CELL = _MAIN_NS[1:-1] + '|c'
+_X_VALUE = _MAIN_NS[1:-1] + '|v'
+_X_TEXT = _MAIN_NS[1:-1] + '|t'
+_X_PHONETIC = _MAIN_NS[1:-1] + '|rPh'
+
+_CHUNK_SIZE = 1 << 16
+
+WINDOWS_EPOCH = datetime.datetime(1899, 12, 30)
+MAC_EPOCH = datetime.datetime(1904, 1, 1)
+SECS_PER_DAY = 86400
+
+# Built-in number formats which represent dates or times.
+_BUILTIN_DATE_FORMATS = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 47}
+_BUILTIN_TIMEDELTA_FORMATS = {46}
+
+_ESCAPED_CHAR = re.compile(r'_x([0-9A-Fa-f]{4})_')
+# The same rules as `openpyxl.styles.numbers`, so both readers agree on which
+# cells are dates
+_STRIP_FORMAT = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+_DATE_TOKEN = re.compile(r'(?<![_\\])[dmhysDMHYS]')
+_TIMEDELTA_FORMAT = re.compile(r'\[hh?\](:mm(:ss(\.0*)?)?)?|\[mm?\](:ss(\.0*)?)?|\[ss?\](\.0*)?')
+
+
+class XlsxFormatError(Exception):
+    """The file is not a workbook this reader understands.
+    """
+    pass
+
+
+class XlsxSheet:
+    """The values of one worksheet of an .xlsx file. Each call to `iter_rows`
+    re-reads the worksheet from the file, so nothing but the shared strings
+    and cell date styles are held in memory.
+    """
+    def __init__(self, file_path: str, sheet_path: str, shared_strings: list[str], date_styles: dict[int, bool], epoch: datetime.datetime, max_row: int, max_column: int):
+        self.file_path = file_path
+        self.sheet_path = sheet_path
+        self.shared_strings = shared_strings
+        # Style index -> whether the style shows a duration rather than a date,
+        # for styles that format numbers as dates or times
+        self.date_styles = date_styles
+        self.epoch = epoch
+        self.max_row = max_row
+        self.max_column = max_column
+
+    def iter_rows(self, min_row: int=1, max_row: int=None, values_only: bool=True):
+        """Yields a tuple of cell values for each row from `min_row` to `max_row`
+        (inclusive, 1-based). Like openpyxl, missing rows are yielded as empty
+        rows and rows are padded with `None` to `max_column`. Only
+        `values_only=True` is supported.
+        """
+        if not values_only:
+            raise ValueError('XlsxSheet only supports reading values.')
+
+        empty_row = (None,) * self.max_column
+
+        with zipfile.ZipFile(self.file_path) as archive, archive.open(self.sheet_path) as sheet_xml:
+            row_num = 0
+
+            for row_ref, values in _parse_rows(sheet_xml, self.shared_strings, self.date_styles, self.epoch):
+                prev_row_num = row_num
+                row_num = row_ref if row_ref is not None else prev_row_num + 1
+
+                # Yield rows that have no cells in the file
+                for _ in range(max(prev_row_num + 1, min_row), min(row_num, max_row + 1 if max_row is not None else row_num)):
+                    yield empty_row
+
+                if max_row is not None and row_num > max_row:
+                    return
+
+                if row_num >= min_row:
+                    if len(values) < self.max_column:
+                        values.extend([None] * (self.max_column - len(values)))
+                    yield tuple(values)
+
+
+def open_sheet(file_path: str) -> XlsxSheet:
+    """Open the active worksheet of the .xlsx file at `file_path`. Raises an
+    `XlsxFormatError` if the file is not a readable workbook.
+    """
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            workbook_path = _office_document_path(archive)
+            workbook_rels = _relationships(archive, workbook_path)
+
+            workbook = parse(archive.open(workbook_path)).getroot()
+            if workbook.tag != _MAIN_NS + 'workbook':
+                raise XlsxFormatError(f'{file_path} uses an unsupported workbook format.')
+            sheet_path = _active_sheet_path(workbook, workbook_rels)
+            epoch = _epoch(workbook)
+
+            shared_strings = []
+            styles_path = None
+            for rel_type, target in workbook_rels.values():
+                if rel_type.endswith('/sharedStrings'):
+                    shared_strings = _read_shared_strings(archive, target)
+                elif rel_type.endswith('/styles'):
+                    styles_path = target
+
+            date_styles = _read_date_styles(archive, styles_path) if styles_path else {}
+            max_row, max_column = _read_dimensions(archive, sheet_path)
+
+    except (zipfile.BadZipFile, KeyError, SyntaxError) as e:
+        # ElementTree's ParseError is a SyntaxError
+        raise XlsxFormatError(f'{file_path} is not a valid .xlsx workbook.') from e
+
+    return XlsxSheet(file_path, sheet_path, shared_strings, date_styles, epoch, max_row, max_column)
+
+
+def from_excel(value: float, epoch: datetime.datetime=WINDOWS_EPOCH, timedelta: bool=False) -> datetime.datetime | datetime.time | datetime.timedelta:
+    """Convert an Excel serial date to a datetime, rounding to the millisecond
+    like openpyxl does. Values less than one day become a `time`.
+    """
+    if timedelta:
+        td = datetime.timedelta(days=value)
+        if td.microseconds:
+            td = datetime.timedelta(seconds=td.total_seconds() // 1, microseconds=round(td.microseconds, -3))
+        return td
+
+    day, fraction = divmod(value, 1)
+    diff = datetime.timedelta(milliseconds=round(fraction * SECS_PER_DAY * 1000))
+    if 0 <= value < 1 and diff.days == 0:
+        mins, seconds = divmod(diff.seconds, 60)
+        hours, mins = divmod(mins, 60)
+        return datetime.time(hours, mins, seconds, diff.microseconds)
+    # Excel pretends 1900 was a leap year
+    if 0 < value < 60 and epoch == WINDOWS_EPOCH:
+        day += 1
+    return epoch + datetime.timedelta(days=day) + diff
+
+
+# ===== internal helper functions ===== #
+
+
+
+def _parse_rows(sheet_xml, shared_strings: list[str], date_styles: dict[int, bool], epoch: datetime.datetime):
+    """Stream-parses worksheet XML with expat, yielding a `(row number, values)`
+    pair for each `<row>` in the file. The row number is `None` if the row
+    doesn't specify one. Expat is used directly, rather than ElementTree, so
+    that no element objects are built for the cells.
+    """
+    parsed_rows = []
+    values: list = None
+    row_ref: str = None
+    cell_col = 0
+    cell_type: str = None
+    cell_style: str = None
+    text_parts: list[str] = None
+    collecting = False
+    in_phonetic = False
+
+    def start_element(name: str, attrs: dict[str, str]):
+        nonlocal values, row_ref, cell_col, cell_type, cell_style, text_parts, collecting, in_phonetic
+        if name == _X_CELL:
+            cell_ref = attrs.get('r')
+            cell_col = _column_index(cell_ref.rstrip('0123456789')) if cell_ref is not None else len(values)
+            cell_type = attrs.get('t', 'n')
+            cell_style = attrs.get('s')
+            text_parts = None
+        elif name == _X_VALUE or (name == _X_TEXT and not in_phonetic):
+            if text_parts is None:
+                text_parts = []
+            collecting = True
+        elif name == _X_ROW:
+            values = []
+            row_ref = attrs.get('r')
+        elif name == _X_PHONETIC:
+            in_phonetic = True
+
+    def end_element(name: str):
+        nonlocal collecting, in_phonetic
+        if name == _X_VALUE or name == _X_TEXT:
+            collecting = False
+        elif name == _X_CELL:
+            text = ''.join(text_parts) if text_parts is not None else None
+            value = _cell_value(cell_type, cell_style, text, shared_strings, date_styles, epoch)
+            if cell_col < len(values):
+                values[cell_col] = value
+            else:
+                if cell_col > len(values):
+                    values.extend([None] * (cell_col - len(values)))
+                values.append(value)
+        elif name == _X_ROW:
+            parsed_rows.append((int(row_ref) if row_ref is not None else None, values))
+        elif name == _X_PHONETIC:
+            in_phonetic = False
+
+    def character_data(data: str):
+        if collecting:
+            text_parts.append(data)
+
+    parser = expat.ParserCreate(namespace_separator='|')
+    parser.buffer_text = True
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+
+    while chunk := sheet_xml.read(_CHUNK_SIZE):
+        parser.Parse(chunk, False)
+        yield from parsed_rows
+        parsed_rows.clear()
+
+    parser.Parse(b'', True)
+    yield from parsed_rows
+
+
+def _cell_value(data_type: str, style: str, text: str, shared_strings: list[str], date_styles: dict[int, bool], epoch: datetime.datetime):
+    """Returns the value of a cell the way openpyxl reads it, from its type
+    (`t`) and style (`s`) attributes and the text of its value.
+    """
+    if text is None:
+        return None
+    # An empty value, such as that of a formula that was never calculated, is
+    # only kept for string cells
+    if text == '' and data_type in ('n', 's', 'b', 'd'):
+        return None
+
+    if data_type == 'n':
+        number = float(text) if ('.' in text or 'E' in text or 'e' in text) else int(text)
+        if style is not None:
+            is_timedelta = date_styles.get(int(style))
+            if is_timedelta is not None:
+                return from_excel(number, epoch, timedelta=is_timedelta)
+        return number
+    if data_type == 's':
+        return shared_strings[int(text)]
+    if data_type == 'inlineStr':
+        return _unescape(text)
+    if data_type == 'b':
+        return text == '1'
+    if data_type == 'd':
+        return datetime.datetime.fromisoformat(text)
+    # 'str' (formula result) and 'e' (error) are kept as text
+    return text
+
+
+def _string_text(elem) -> str:
+    """Returns the text of a shared or inline string element, skipping
+    phonetic runs.
+    """
+    text = elem.findtext(_TEXT)
+    if text is None:
+        text = ''.join(run.findtext(_TEXT, '') for run in elem.iter(_RICH_RUN))
+    return _unescape(text)
+
+
+def _unescape(text: str) -> str:
+    """Replaces the `_xHHHH_` escapes Excel uses for special characters.
+    """
+    if '_x' in text:
+        text = _ESCAPED_CHAR.sub(lambda m: chr(int(m.group(1), 16)), text)
+    return text
+
+
+@lru_cache(maxsize=None)
+def _column_index(letters: str) -> int:
+    """Returns the 0-based index of a column from its letters (e.g., 'A' -> 0).
+    """
+    index = 0
+    for char in letters:
+        index = index * 26 + (ord(char) - 64)
+    return index - 1
+
+
+def _office_document_path(archive: zipfile.ZipFile) -> str:
+    """Returns the path of the workbook part inside the archive.
+    """
+    for rel_type, target in _relationships(archive, '').values():
+        if rel_type.endswith('/officeDocument'):
+            return target
+    return 'xl/workbook.xml'
+
+
+def _relationships(archive: zipfile.ZipFile, part_path: str) -> dict[str, tuple[str, str]]:
+    """Returns the relationships of the part at `part_path` as a dict of
+    id -> (type, target path inside the archive).
+    """
+    part_dir, part_name = posixpath.split(part_path)
+    rels_path = posixpath.join(part_dir, '_rels', f'{part_name}.rels')
+
+    try:
+        rels = parse(archive.open(rels_path)).getroot()
+    except KeyError:
+        return {}
+
+    relationships = {}
+    for rel in rels.iter(_PKG_REL_NS + 'Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(part_dir, target))
+        relationships[rel.get('Id')] = (rel.get('Type'), target)
+
+    return relationships
+
+
+def _active_sheet_path(workbook, workbook_rels: dict[str, tuple[str, str]]) -> str:
+    """Returns the archive path of the workbook's active sheet.
+    """
+    active_tab = 0
+    view = workbook.find(f'{_MAIN_NS}bookViews/{_MAIN_NS}workbookView')
+    if view is not None:
+        active_tab = int(view.get('activeTab', 0))
+
+    sheets = workbook.findall(f'{_MAIN_NS}sheets/{_MAIN_NS}sheet')
+    if active_tab >= len(sheets):
+        active_tab = 0
+
+    _, sheet_path = workbook_rels[sheets[active_tab].get(_REL_NS + 'id')]
+    return sheet_path
+
+
+def _epoch(workbook) -> datetime.datetime:
+    """Returns the date system of the workbook.
+    """
+    properties = workbook.find(_MAIN_NS + 'workbookPr')
+    if properties is not None and properties.get('date1904') in ('1', 'true'):
+        return MAC_EPOCH
+    return WINDOWS_EPOCH
+
+
+def _read_shared_strings(archive: zipfile.ZipFile, path: str) -> list[str]:
+    """Returns the shared strings table of the workbook.
+    """
+    shared_strings = []
+    with archive.open(path) as strings_xml:
+        for _, elem in iterparse(strings_xml):
+            if elem.tag == _SHARED_STRING:
+                shared_strings.append(_string_text(elem))
+                elem.clear()
+
+    return shared_strings
+
+
+def _read_date_styles(archive: zipfile.ZipFile, path: str) -> dict[int, bool]:
+    """Returns a dict of cell style index -> whether it is a duration, for
+    every cell style which formats numbers as dates, times or durations.
+    """
+    styles = parse(archive.open(path)).getroot()
+
+    custom_formats = {
+        int(fmt.get('numFmtId')): fmt.get('formatCode', '')
+        for fmt in styles.iterfind(f'{_MAIN_NS}numFmts/{_MAIN_NS}numFmt')
+    }
+
+    date_styles = {}
+    for index, xf in enumerate(styles.iterfind(f'{_MAIN_NS}cellXfs/{_MAIN_NS}xf')):
+        fmt_id = int(xf.get('numFmtId', 0))
+
+        if fmt_id in custom_formats:
+            is_date, is_timedelta = _classify_format(custom_formats[fmt_id])
+        else:
+            is_timedelta = fmt_id in _BUILTIN_TIMEDELTA_FORMATS
+            is_date = is_timedelta or fmt_id in _BUILTIN_DATE_FORMATS
+
+        if is_date:
+            date_styles[index] = is_timedelta
+
+    return date_styles
+
+
+@lru_cache(maxsize=None)
+def _classify_format(format_code: str) -> tuple[bool, bool]:
+    """Returns whether a number format code shows a date or time, and whether
+    it shows an elapsed duration (e.g., `[h]:mm`).
+    """
+    # Only the first section (positive numbers) decides, ignoring quoted text,
+    # bracketed colours/locales and escaped (`\h`) or padding (`_h`) characters
+    first_section = format_code.split(';')[0]
+    is_date = _DATE_TOKEN.search(_STRIP_FORMAT.sub('', first_section)) is not None
+    is_timedelta = _TIMEDELTA_FORMAT.search(first_section) is not None
+
+    return (is_date, is_timedelta)
+
+
+def _read_dimensions(archive: zipfile.ZipFile, sheet_path: str) -> tuple[int, int]:
+    """Returns the (max_row, max_column) of a worksheet. These are read from its
+    `<dimension>` element, which some writers leave out or get wrong, so the
+    column count is never less than the width of the first row.
+    """
+    max_row, max_column = None, 0
+
+    with archive.open(sheet_path) as sheet_xml:
+        for _, elem in iterparse(sheet_xml):
+            if elem.tag == _DIMENSION:
+                last_cell = elem.get('ref', 'A1').split(':')[-1]
+                letters = last_cell.rstrip('0123456789')
+                if letters and last_cell != letters:
+                    max_row = int(last_cell[len(letters):])
+                    max_column = _column_index(letters) + 1
+
+            elif elem.tag == _ROW:
+                cells = [cell for cell in elem if cell.tag == _CELL]
+                last_ref = cells[-1].get('r') if cells else None
+                row_width = _column_index(last_ref.rstrip('0123456789')) + 1 if last_ref else len(cells)
+                return (max_row, max(max_column, row_width))
+
+    return (max_row, max_column)
@@ -0,0 +1,89 @@
+from typing import TYPE_CHECKING, Callable, Iterable
+
+if TYPE_CHECKING:
+    from venues.records import JobRecord, VenueRecord
+
+
+class VenueAggregates:
+    """Per-venue and per-zone metrics for a whole set of venues, computed in
+    one vectorized pass with NumPy grouped reductions rather than with a loop
+    over every venue for each row that is written.
+
+    Venues are looked up by object id, like in `ReportContext`.
+    """
+    def __init__(self, venue_records: Iterable['VenueRecord'], latest_job: Callable[['VenueRecord'], 'JobRecord']):
+        """Aggregate `venue_records`. `latest_job` returns the latest job of a
+        venue (e.g., `ReportContext.latest_job`).
+        """
+        import numpy as np
+
+        # In key order, so that ties below are broken the same way every run
+        venues = sorted(venue_records, key=lambda venue: venue.key)
+        self._venues = venues
+        self._venue_index = {id(venue): i for i, venue in enumerate(venues)}
+
+        # Group venues by (market, zone). Zone codes are reused across markets.
+        zone_index: dict[tuple[str, str], int] = {}
+        venue_zones = np.fromiter(
+            (zone_index.setdefault((venue.market, venue.zone), len(zone_index)) for venue in venues),
+            dtype=np.int64, count=len(venues))
+        self._zone_index = zone_index
+
+        # Flatten every job into arrays keyed by the index of its venue
+        job_counts = np.fromiter((len(venue.job_records) for venue in venues), dtype=np.int64, count=len(venues))
+        num_jobs = int(job_counts.sum())
+        job_venues = np.repeat(np.arange(len(venues), dtype=np.int64), job_counts)
+        job_stats = np.fromiter(
+            (value for venue in venues for job in venue.job_records for value in (job.rvsps + job.rmi, job.quantity)),
+            dtype=np.int64, count=2 * num_jobs).reshape(num_jobs, 2)
+
+        # Per-venue sums. Sums of integers are exact, so the ratio below is
+        # the same as one computed job by job.
+        total_responses = np.bincount(job_venues, weights=job_stats[:, 0], minlength=len(venues))
+        total_quantity = np.bincount(job_venues, weights=job_stats[:, 1], minlength=len(venues))
+
+        self._total_quantity = total_quantity
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._ror_ratio = np.where(total_quantity > 0, 100 * total_responses / total_quantity, 0)
+
+        # Per-zone number of jobs
+        self._zone_visits = np.bincount(venue_zones, weights=job_counts, minlength=len(zone_index)).astype(np.int64)
+
+        # Per-zone most recent job end date, and the first venue (in key
+        # order) whose latest job ended then
+        end_dates = np.array([latest_job(venue).end_date for venue in venues], dtype='datetime64[us]').astype(np.int64)
+        zone_latest = np.full(len(zone_index), np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(zone_latest, venue_zones, end_dates)
+
+        is_zone_latest = end_dates == zone_latest[venue_zones]
+        zone_latest_venue = np.full(len(zone_index), len(venues), dtype=np.int64)
+        np.minimum.at(zone_latest_venue, venue_zones[is_zone_latest], np.flatnonzero(is_zone_latest))
+
+        self._venue_zones = venue_zones
+        self._is_zone_latest = is_zone_latest
+        self._zone_latest_venue = zone_latest_venue
+
+    def average_ror(self, venue: 'VenueRecord') -> float:
+        """Total number of RSVPs and RMIs across all jobs of `venue` divided by
+        their total quantity, and multiplied by 100 (to express as a percent).
+        """
+        i = self._venue_index[id(venue)]
+        if self._total_quantity[i] == 0:
+            return 0
+        # Python's round() is used, like for JobRecord.ror
+        return round(float(self._ror_ratio[i]), 3)
+
+    def zone_visits(self, venue: 'VenueRecord') -> int:
+        """Total number of jobs across all venues in the market and zone of `venue`.
+        """
+        return int(self._zone_visits[self._venue_zones[self._venue_index[id(venue)]]])
+
+    def last_zone_venue(self, venue: 'VenueRecord') -> 'VenueRecord':
+        """The venue in the market and zone of `venue` with the most recent job.
+        `venue` itself is preferred if it is tied for the most recent, and
+        otherwise the tied venue with the lowest key.
+        """
+        i = self._venue_index[id(venue)]
+        if self._is_zone_latest[i]:
+            return venue
+        return self._venues[self._zone_latest_venue[self._venue_zones[i]]]
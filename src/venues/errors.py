@@ -6,4 +6,24 @@ class NoValidSessionsException(Exception):
 class HashError(Exception):
      """Object data not hashable.
      """
-     pass
\ No newline at end of file
+     pass
+
+class MissingHeadersError(Exception):
+    """Spreadsheet is missing one or more expected column headers.
+    """
+    def __init__(self, missing_headers: list[str]):
+        super().__init__(f'Missing headers: {", ".join(missing_headers)}')
+        self.missing_headers = missing_headers
+
+    def __reduce__(self):
+        # So it can be raised in a worker process and re-raised in the parent
+        return (MissingHeadersError, (self.missing_headers,))
+
+
+class InvalidFieldError(ValueError):
+    """Entry contains a value which cannot be converted to the field's type.
+    """
+    def __init__(self, column: str, value):
+        super().__init__(f"Invalid value {value!r} in column '{column}'.")
+        self.column = column
+        self.value = value
@@ -0,0 +1,131 @@
+import math
+import os
+import sys
+from functools import cache
+from typing import TYPE_CHECKING, Iterable, Iterator
+
+if TYPE_CHECKING:
+    from venues.records import VenueRecord
+
+
+# The ZIP code centroid table bundled with the program: a ZIP, LAT, LNG CSV
+# derived from the data of the zipcodes package (see
+# data/zip_centroids.LICENSE.txt). The Census Bureau's tab-separated ZCTA
+# Gazetteer file (GEOID, INTPTLAT, INTPTLONG) can be read as well. The
+# frozen executable unpacks data files under sys._MEIPASS (see
+# data_direct.spec). Radius-based saturation is only offered when the
+# table exists.
+_SOURCE_ROOT = getattr(sys, '_MEIPASS', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ZIP_CENTROIDS_PATH = os.path.join(_SOURCE_ROOT, 'venues', 'data', 'zip_centroids.csv')
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def has_zip_centroids(path: str=ZIP_CENTROIDS_PATH) -> bool:
+    """Whether the ZIP code centroid table is available.
+    """
+    return os.path.isfile(path)
+
+
+@cache
+def load_zip_centroids(path: str=ZIP_CENTROIDS_PATH) -> dict[int, tuple[float, float]]:
+    """Returns the `(latitude, longitude)` of each ZIP code in the centroid
+    table, in degrees. Returns an empty table if there is none. Rows that
+    can't be read are skipped.
+    """
+    if not has_zip_centroids(path):
+        return {}
+
+    centroids: dict[int, tuple[float, float]] = {}
+    with open(path, newline='', encoding='utf-8-sig') as table_file:
+        header = table_file.readline()
+        delimiter = '\t' if '\t' in header else ','
+        columns = [name.strip().upper() for name in header.split(delimiter)]
+        zip_col = _column(columns, ('GEOID', 'ZIP', 'ZCTA5'))
+        lat_col = _column(columns, ('INTPTLAT', 'LAT', 'LATITUDE'))
+        lon_col = _column(columns, ('INTPTLONG', 'LNG', 'LON', 'LONGITUDE'))
+
+        for line in table_file:
+            values = line.split(delimiter)
+            try:
+                centroids[int(values[zip_col])] = (float(values[lat_col]), float(values[lon_col]))
+            except (IndexError, ValueError):
+                continue
+
+    return centroids
+
+
+def distance_miles(a: tuple[float, float], b: tuple[float, float]) -> float:
+    """Great-circle distance between two `(latitude, longitude)` points.
+    """
+    lat_a, lon_a = math.radians(a[0]), math.radians(a[1])
+    lat_b, lon_b = math.radians(b[0]), math.radians(b[1])
+    h = (math.sin((lat_b - lat_a) / 2) ** 2
+         + math.cos(lat_a) * math.cos(lat_b) * math.sin((lon_b - lon_a) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(h)))
+
+
+class ProximityIndex:
+    """Finds the venues within a radius of a venue, by the centroid of their
+    ZIP codes. Venues are bucketed into a grid of cells one radius high, so a
+    query only measures the distance to venues in the few cells around it
+    rather than to every venue.
+
+    Only venues in the same market are considered near each other, so that
+    a market's report doesn't depend on other markets (see `_report_market()`).
+    Venues whose ZIP code isn't in the centroid table are never near any
+    other venue.
+    """
+    def __init__(self, venue_records: Iterable['VenueRecord'], radius_miles: float, centroids: dict[int, tuple[float, float]]):
+        self.radius_miles = radius_miles
+        self.centroids = centroids
+
+        # Angular radius, and the grid cell size in degrees
+        self._radius = radius_miles / EARTH_RADIUS_MILES
+        self._cell = math.degrees(self._radius)
+
+        # Venues are added in key order so that queries return them in the
+        # same order every run.
+        self._cells: dict[tuple[str, int, int], list[tuple['VenueRecord', tuple[float, float]]]] = {}
+        for venue in sorted(venue_records, key=lambda venue: venue.key):
+            point = centroids.get(venue.zip)
+            if point is not None:
+                self._cells.setdefault(self._cell_key(venue.market, point), []).append((venue, point))
+
+    def within(self, venue: 'VenueRecord') -> Iterator['VenueRecord']:
+        """Yields each indexed venue in the market of `venue` within the radius
+        of it, including `venue` itself if it is indexed.
+        """
+        point = self.centroids.get(venue.zip)
+        if point is None:
+            return
+
+        _, row, col = self._cell_key(venue.market, point)
+
+        # Points within the radius are at most one cell away in latitude. In
+        # longitude, that distance spans more cells the farther from the
+        # equator (see "bounding coordinates" for points on a sphere).
+        cos_lat = math.cos(math.radians(point[0]))
+        if math.sin(self._radius) >= cos_lat:
+            num_cols = math.ceil(360 / self._cell)
+        else:
+            lon_span = math.degrees(math.asin(math.sin(self._radius) / cos_lat))
+            num_cols = math.ceil(lon_span / self._cell)
+
+        for other_row in (row - 1, row, row + 1):
+            for other_col in range(col - num_cols, col + num_cols + 1):
+                for other, other_point in self._cells.get((venue.market, other_row, other_col), ()):
+                    if distance_miles(point, other_point) <= self.radius_miles:
+                        yield other
+
+    def _cell_key(self, market: str, point: tuple[float, float]) -> tuple[str, int, int]:
+        return (market, math.floor(point[0] / self._cell), math.floor(point[1] / self._cell))
+
+
+# ===== internal helper functions ===== #
+
+def _column(columns: list[str], names: tuple[str]) -> int:
+    for name in names:
+        if name in columns:
+            return columns.index(name)
+    raise ValueError(f'The ZIP code centroid table has no {names[0]} column.')
@@ -1,11 +1,24 @@
-from dataclasses import dataclass
-from typing import Union
-from dateutil.relativedelta import relativedelta
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Union
 from datetime import datetime
-import math
 import re
 from misc import utils
-from venues.errors import HashError, NoValidSessionsException
+from venues.errors import HashError, InvalidFieldError, NoValidSessionsException
+
+if TYPE_CHECKING:
+    from venues.report_context import ReportContext
+
+_STREET_NUMBER = re.compile(r'[0-9]+')
+
+
+def int_field(entry: dict[str, str], column: str) -> int:
+    """Returns the value of `column` in `entry` as an `int`. Raises an
+    `InvalidFieldError` naming the column if it can't be converted.
+    """
+    try:
+        return int(entry[column])
+    except (TypeError, ValueError):
+        raise InvalidFieldError(column, entry[column]) from None
 
 
 class VenueRecord:
@@ -21,60 +34,44 @@ class VenueRecord:
         self.state = state
         self.zip = zip
         self.job_records: set['JobRecord'] = set()
-    
-    def __hash__(self):
-        # Hashing is done only with zone and street
-        # number so that if some data is not formatted
-        # in the same way, that's okay.
-        try:
-            return hash((
-                self.market,
-                self.zone,
-                re.findall(r'[0-9]+', self.street)[0]
-            ))
-        except IndexError as e:
-            raise HashError(f"The address '{self.street}' contains no number to use for hashing.")
+        # Number of job rows which were duplicates of a job already recorded
+        self.duplicate_jobs = 0
+        self.key = VenueRecord.identity_key(market, zone, street)
 
-    def __eq__(self, other: 'VenueRecord') -> bool:
-        return self.__hash__() == other.__hash__()
+    @staticmethod
+    def identity_key(market: str, zone: str, street: str) -> tuple[str, str, str]:
+        """Returns the key identifying a venue.
 
-    @property
-    def average_rsvps(self) -> int:
-        """Average number of RSVPs for all jobs with this venue,
-        rounded up to the nearest whole number.
+        Identity is based only on market, zone and street
+        number so that if some data is not formatted
+        in the same way, that's okay.
+        Raises a `HashError` if the street has no number.
         """
-        if len(self.job_records) == 0:
-            return 0.0
-        
-        total_rsvps = sum(job.rvsps for job in self.job_records)
-        return  math.ceil(total_rsvps / len(self.job_records))
+        match = _STREET_NUMBER.search(street)
+        if match is None:
+            raise HashError(f"The address '{street}' contains no number to use for hashing.")
 
-    @property
-    def average_ror(self) -> float:
-        """Total number of RSVPs and RMIs across all
-        jobs divided by total quantity,
-        and multiplied by 100 (to express as a percent).
-        """
+        return (market, zone, match.group())
 
-        total_rsvps_rmis = 0
-        total_quantity = 0
+    def __hash__(self):
+        return hash(self.key)
 
-        for job in self.job_records:
-            total_rsvps_rmis += job.rvsps + job.rmi
-            total_quantity += job.quantity
-        
-        if total_quantity == 0:
-            return 0
-        
-        return round(100 * total_rsvps_rmis / total_quantity, 3)
+    def __eq__(self, other: 'VenueRecord') -> bool:
+        if not isinstance(other, VenueRecord):
+            return NotImplemented
+        return self.key == other.key
 
     @property
     def latest_job(self) -> 'JobRecord':
+        """The job that ended last. Ties are broken by job key rather than by
+        the iteration order of `job_records`, which changes when records are
+        pickled (e.g., when sent back from a worker process).
+        """
         latest_job: JobRecord = None
         
         for job in self.job_records:
             if (latest_job is None
-                or latest_job.end_date < job.end_date):
+                or (latest_job.end_date, latest_job.key) < (job.end_date, job.key)):
                 latest_job = job
         
         return latest_job
@@ -85,13 +82,13 @@ class VenueRecord:
         """
         new_venue = VenueRecord(
             VenueRecord.strip_field(entry['MKT']),
-            int(entry['LOC#']),
+            int_field(entry, 'LOC#'),
             VenueRecord.strip_field(entry['Zone']),
             VenueRecord.strip_field(entry['Restaurant']),
             VenueRecord.strip_field(entry['St Address']),
             VenueRecord.strip_field(entry['City']),
             VenueRecord.strip_field(entry['ST']),
-            int(entry['ZIP']))
+            int_field(entry, 'ZIP'))
 
         new_venue.add_job_record(entry)
         
@@ -107,62 +104,42 @@ class VenueRecord:
     # IMPORTANT the header order MUST match
     # the order of data in to_entry()'s returned tuple.
     # there is no mechanism checking if they match.
-    def to_entry(self, start_date: datetime, end_date: datetime, prox_weeks: int, venue_records: list['VenueRecord']) -> tuple[str]:
-        """Returns a spreadsheet-ready tuple representation of this venue for the given date range.
-        Args:
-            start_date (datetime): The start date of the scheduling period.
-            end_date (datetime): The end date of the scheduling period.
+    def to_entry(self, context: 'ReportContext') -> tuple[str]:
+        """Returns a spreadsheet-ready tuple representation of this venue for the
+        scheduling period of `context`. This venue must be one of the context's
+        venue records.
         """
 
         # Compute the qualifying job for this venue
-        qual_job = self.around_time_last_year(start_date, end_date, prox_weeks)
+        qual_job = context.qualifying_session(self)
 
         qual_job_date = qual_job[0].datetime.strftime("%m/%d/%Y") if qual_job is not None else ''
         qual_job_rsvps = qual_job[1].rvsps if qual_job is not None else ''
         qual_job_ror = qual_job[1].ror if qual_job is not None else ''
 
+        latest_job = context.latest_job(self)
         
-        # Compute the last time we visited this zone, and where
-        last_zone_venue = self
-
-        # Check other venues
-        for otherVenue in venue_records:
-            # If other venue is in this zone, check to see if its last date is after
-            # this current last_zone_visit date.
-            # Zone names are not unique to markets, so, e.g., G101 Inner
-            # Could appear in multiple markets.
-            if (otherVenue.zone == self.zone
-                and otherVenue.market == self.market
-                and otherVenue.latest_job.end_date > last_zone_venue.latest_job.end_date):
-
-                last_zone_venue = otherVenue
-        
-        num_zone_visits = 0
-        # Calculate number of times we have visited this zone since the cutoff date
-        # since data before cutoff is already excluded, we simply count as normal
-        for venue in venue_records:
-
-            if (venue.zone == self.zone
-                and venue.market == self.market):
-                
-                num_zone_visits += len(venue.job_records)
-
-
-        # TODO we can combine the above two loops into one.
-
+        # The last time we visited this zone (or, with a saturation radius,
+        # anywhere nearby), and where, and the number of times we have visited
+        # this zone since the cutoff date. Zone names are not unique to
+        # markets, so, e.g., G101 Inner could appear in multiple markets; the
+        # aggregates group by both.
+        last_zone_venue = context.last_nearby_venue(self)
+        last_zone_job = context.latest_job(last_zone_venue)
+        num_zone_visits = context.aggregates.zone_visits(self)
 
         # Create our entry and return it
         return (
-            self.latest_job.id,
-            self.latest_job.user,
+            latest_job.id,
+            latest_job.user,
             self.market,
             self.loc_num,
-            self.latest_job.week,
+            latest_job.week,
 
             self.zone,
-            last_zone_venue.latest_job.end_date.strftime("%m/%d/%Y"),
+            last_zone_job.end_date.strftime("%m/%d/%Y"),
             last_zone_venue.restaurant,
-            last_zone_venue.latest_job.ror,
+            last_zone_job.ror,
 
             self.restaurant,
             self.street,
@@ -171,46 +148,28 @@ class VenueRecord:
             self.zip,
             "Menu",  # Rod wants everything to say Menu
 
-            self.latest_job.quantity,
-            self.latest_job.sessions[-1].datetime.strftime("%m/%d/%Y"),
-            self.latest_job.num_sessions,
-            self.latest_job.session_type,
-            self.latest_job.rvsps,
-            self.latest_job.rmi,
-            self.latest_job.ror,
+            latest_job.quantity,
+            latest_job.sessions[-1].datetime.strftime("%m/%d/%Y"),
+            latest_job.num_sessions,
+            latest_job.session_type,
+            latest_job.rvsps,
+            latest_job.rmi,
+            latest_job.ror,
 
             qual_job_date,
             qual_job_rsvps,
             qual_job_ror,
 
             num_zone_visits,
-            self.average_ror
+            context.aggregates.average_ror(self)
         )
     
-    def jobs_within(self, time: relativedelta, ref_date: datetime=None) -> list['JobRecord']:
-        """Returns a list of all jobs within `time` of `ref_date`. ref_date
-        will default to now if not provided.
+    def qualifying_session(self, start_threshold: datetime, end_threshold: datetime) -> Union[tuple[Union['SessionRecord', 'JobRecord']], None]:
+        """Returns a tuple with the first session (and its job record) found between
+        `start_threshold` and `end_threshold`, inclusive, or `None` if there is none.
+        Jobs are searched in key order (see `latest_job`).
         """
-
-        if ref_date is None:
-            ref_date = datetime.now()
-
-        jobs = []
-        for job in self.job_records:
-                if job.end_date >= ref_date - time:
-                    jobs.append(job)
-                    
-        return jobs
-    
-    def around_time_last_year(self, start_date: datetime, end_date: datetime, prox_weeks: int) -> Union[tuple[Union['SessionRecord', 'JobRecord']], None]:
-        """Returns a tuple with the session and job record that qualifies this job as around the same
-        time last year (specifically, the session must be within `prox_weeks` of the start or end
-        date or be between the two).
-        """
-        start_threshold = start_date - relativedelta(years=1) - relativedelta(weeks=prox_weeks)
-        end_threshold = end_date - relativedelta(years=1) + relativedelta(weeks=prox_weeks)
-
-        for job in self.job_records:
+        for job in sorted(self.job_records, key=lambda job: job.key):
             for session in job.sessions:
                 if (session.datetime >= start_threshold and
                     session.datetime <= end_threshold):
@@ -218,12 +177,22 @@ class VenueRecord:
         
         return None
 
-    def add_job_record(self, entry: dict[str, str]) -> None:
+    def add_job_record(self, entry: dict[str, str]) -> bool:
         """Create a job record for `entry` and add it to this venue's job records
-        if the job entry is valid.
+        if the job entry is valid. Returns `False` if the job was a duplicate.
         """
-        new_job = JobRecord.from_entry(entry)
-        self.job_records.add(new_job)
+        return self.add_job(JobRecord.from_entry(entry))
+
+    def add_job(self, job: 'JobRecord') -> bool:
+        """Add `job` to this venue's job records, unless a job with the same key
+        is already recorded. Returns `False` (and counts the duplicate) if it was.
+        """
+        if job in self.job_records:
+            self.duplicate_jobs += 1
+            return False
+
+        self.job_records.add(job)
+        return True
         
 
 @dataclass(frozen=True)
@@ -244,22 +213,21 @@ class JobRecord:
     rvsps: int
     rmi: int
 
+    # Identity of the job: Job# plus the week and year it ran, in case job
+    # numbers are reused. Other fields (e.g., RSVPs) may differ between
+    # duplicate rows of the same job; the first row seen is kept.
+    key: tuple[int, int, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'key', (self.id, self.year, self.week))
+
     def __hash__(self):
-        return hash((
-            self.id,
-            self.user,
-            self.week,
-            self.mail_piece,
-            self.month,
-            self.year,
-            self.num_sessions,
-            self.quantity,
-            self.rvsps,
-            self.rmi
-        ))
+        return hash(self.key)
 
     def __eq__(self, other: 'JobRecord') -> bool:
-        return self.__hash__() == other.__hash__()
+        if not isinstance(other, JobRecord):
+            return NotImplemented
+        return self.key == other.key
     
     @property
     def month_date(self) -> datetime:
@@ -308,17 +276,17 @@ class JobRecord:
         Returns `None` if unable to create an the job.
         """
         new_job = JobRecord(
-            int(entry['Job#']),
+            int_field(entry, 'Job#'),
             entry['User'],
-            int(entry['Week']),
+            int_field(entry, 'Week'),
             entry['Mail Piece'],
             entry['Month'],
-            int(entry['Year']),
-            int(entry['# Sessions']),
+            int_field(entry, 'Year'),
+            int_field(entry, '# Sessions'),
             SessionRecord.from_entry(entry),
-            int(entry['Qty']),
-            int(entry['RSVPs']),
-            int(entry['RMI']))
+            int_field(entry, 'Qty'),
+            int_field(entry, 'RSVPs'),
+            int_field(entry, 'RMI'))
             
         return new_job
 
@@ -0,0 +1,54 @@
+import csv
+from collections import Counter
+
+
+class RejectionLedger:
+    """Counts source rows skipped during extraction, by reason and column,
+    and keeps a bounded sample of their Job#s. Recording a rejection is a
+    counter increment, so it is cheap enough to do for every row; the ledger
+    is written out once as a summary instead of warning per row.
+    """
+    NO_VALID_SESSIONS = 'No valid sessions'
+    INVALID_VALUE = 'Invalid value'
+    NO_STREET_NUMBER = 'Street address has no number'
+
+    def __init__(self, sample_size: int=10):
+        self.sample_size = sample_size
+        self.counts: Counter[tuple[str, str]] = Counter()
+        self.samples: dict[tuple[str, str], list] = {}
+
+    @property
+    def total(self) -> int:
+        """Total number of rejected rows.
+        """
+        return sum(self.counts.values())
+
+    def reject(self, reason: str, job_id, column: str='') -> None:
+        """Record that the row for `job_id` was skipped for `reason`, because of
+        the value in `column` (if known).
+        """
+        key = (reason, column)
+        self.counts[key] += 1
+
+        sample = self.samples.setdefault(key, [])
+        if len(sample) < self.sample_size:
+            sample.append(job_id)
+
+    def merge(self, other: 'RejectionLedger') -> None:
+        """Add the rejections recorded in `other` to this ledger.
+        """
+        self.counts.update(other.counts)
+        for key, other_sample in other.samples.items():
+            sample = self.samples.setdefault(key, [])
+            sample.extend(other_sample[:self.sample_size - len(sample)])
+
+    def write(self, file_path: str) -> None:
+        """Write a CSV summary of the rejected rows to `file_path`, most common
+        reasons first.
+        """
+        with open(file_path, 'w', newline='', encoding='utf-8-sig') as summary_file:
+            writer = csv.writer(summary_file)
+            writer.writerow(['Reason', 'Column', 'Rows', 'Sample Job#'])
+            for (reason, column), count in self.counts.most_common():
+                sample = ' '.join(str(job_id) for job_id in self.samples[(reason, column)])
+                writer.writerow([reason, column, count, sample])
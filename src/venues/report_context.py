@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Iterable, Union
+
+if TYPE_CHECKING:
+    from venues.aggregates import VenueAggregates
+    from venues.proximity import ProximityIndex
+    from venues.records import JobRecord, SessionRecord, VenueRecord
+
+
+@dataclass(frozen=True)
+class ReportParameters:
+    """The settings of a report run, as entered at the prompts. Every field is
+    part of the digest of a market report (see `market_digest()`), so a
+    report made with different settings is rebuilt rather than kept.
+    """
+    start_date: datetime
+    end_date: datetime
+    saturation_period: int
+    prox_weeks: int
+    min_rsvps: int
+    min_ror: float
+    # Maximum number of venues written per market
+    num_venues: int
+    # Miles around a venue that count as its zone, as well as the zone
+    # itself; 0 to only use zones
+    saturation_radius: float = 0
+
+
+class ReportContext:
+    """The venues and parameters of a single report run, with the date
+    thresholds derived from them computed once. Per-venue results are
+    memoized so that filtering, sorting and writing share them.
+    """
+    def __init__(self, venue_records: Iterable['VenueRecord'], params: ReportParameters, centroids: dict[int, tuple[float, float]]=None):
+        from dateutil.relativedelta import relativedelta
+
+        self.venue_records = venue_records
+        self.params = params
+        # ZIP code centroids used with the radius; the bundled table if None
+        self._centroids = centroids
+
+        # A session qualifies as "around this time last year" if it falls
+        # between these two dates.
+        self.qual_start_threshold = params.start_date - relativedelta(years=1) - relativedelta(weeks=params.prox_weeks)
+        self.qual_end_threshold = params.end_date - relativedelta(years=1) + relativedelta(weeks=params.prox_weeks)
+
+        # A venue saturates its zone if it has a job ending on or after this date.
+        self.saturation_threshold = params.start_date - relativedelta(weeks=params.saturation_period)
+
+        # Caches are keyed by object id rather than by venue, because a venue
+        # hashes and compares through Python-level methods on its key, which
+        # costs more per lookup than an int. Venues outlive the context, so
+        # ids are not reused during a report run.
+        self._qualifying: dict[int, Union[tuple[Union['SessionRecord', 'JobRecord']], None]] = {}
+        self._latest_jobs: dict[int, 'JobRecord'] = {}
+        self._aggregates: 'VenueAggregates' = None
+        self._proximity: 'ProximityIndex' = None
+
+    def qualifying_session(self, venue: 'VenueRecord') -> Union[tuple[Union['SessionRecord', 'JobRecord']], None]:
+        """Returns the session and job record that qualify `venue` as having
+        had a job around this time last year (i.e., a session within
+        `params.prox_weeks` of the scheduling period, a year earlier), or `None`.
+        """
+        key = id(venue)
+        if key not in self._qualifying:
+            self._qualifying[key] = venue.qualifying_session(self.qual_start_threshold, self.qual_end_threshold)
+
+        return self._qualifying[key]
+
+    def latest_job(self, venue: 'VenueRecord') -> 'JobRecord':
+        """Returns the most recent job of `venue`.
+        """
+        key = id(venue)
+        if key not in self._latest_jobs:
+            self._latest_jobs[key] = venue.latest_job
+
+        return self._latest_jobs[key]
+
+    def is_saturating(self, venue: 'VenueRecord') -> bool:
+        """Whether `venue` has had a job within the saturation period
+        before the start of the scheduling period.
+        """
+        return self.latest_job(venue).end_date >= self.saturation_threshold
+
+    @property
+    def aggregates(self) -> 'VenueAggregates':
+        """Venue and zone metrics for all of `venue_records`, computed on first use.
+        """
+        if self._aggregates is None:
+            from venues.aggregates import VenueAggregates
+            self._aggregates = VenueAggregates(self.venue_records, self.latest_job)
+
+        return self._aggregates
+
+    @property
+    def centroids(self) -> dict[int, tuple[float, float]]:
+        """The ZIP code centroid table used for the saturation radius.
+        """
+        if self._centroids is None:
+            from venues.proximity import load_zip_centroids
+            self._centroids = load_zip_centroids()
+
+        return self._centroids
+
+    @property
+    def proximity(self) -> 'ProximityIndex':
+        """Index of all of `venue_records` by location, for the saturation
+        radius, built on first use.
+        """
+        if self._proximity is None:
+            from venues.proximity import ProximityIndex
+            self._proximity = ProximityIndex(self.venue_records, self.params.saturation_radius, self.centroids)
+
+        return self._proximity
+
+    def last_nearby_venue(self, venue: 'VenueRecord') -> 'VenueRecord':
+        """The venue with the most recent job out of those in the market and
+        zone of `venue` and, with a saturation radius, those within it.
+        The venue from the zone (see `VenueAggregates.last_zone_venue()`) is
+        preferred if tied, and otherwise the tied venue with the lowest key.
+        """
+        last_venue = self.aggregates.last_zone_venue(venue)
+        if self.params.saturation_radius <= 0:
+            return last_venue
+
+        last_end_date = self.latest_job(last_venue).end_date
+        nearby_venue = None
+        for other in self.proximity.within(venue):
+            end_date = self.latest_job(other).end_date
+            if (end_date > last_end_date
+                or (end_date == last_end_date and nearby_venue is not None and other.key < nearby_venue.key)):
+                nearby_venue, last_end_date = other, end_date
+
+        return nearby_venue if nearby_venue is not None else last_venue
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from venues.records import VenueRecord
+    from venues.report_context import ReportParameters
+
+
+MANIFEST_NAME = 'MANIFEST.json'
+
+# Bump this whenever the contents or layout of a market report change, so
+# that reports written by an older version are rebuilt rather than kept.
+REPORT_FORMAT_VERSION = 1
+
+
+def market_digest(venue_records: Iterable['VenueRecord'], parameters: 'ReportParameters') -> str:
+    """Returns a hash of everything a market's report is made from: all of the
+    market's venues and their jobs, and the report `parameters` (all of
+    their fields, by their `repr`).
+
+    Venues and jobs are hashed in key order, so the digest doesn't depend on
+    the iteration order of sets, which changes when records are pickled.
+    Reports break ties by key as well, so they don't depend on it either.
+    """
+    digest = hashlib.sha256(repr(parameters).encode())
+    for venue in sorted(venue_records, key=lambda venue: venue.key):
+        digest.update(repr((venue.market, venue.loc_num, venue.zone, venue.restaurant,
+                            venue.street, venue.city, venue.state, venue.zip)).encode())
+        for job in sorted(venue.job_records, key=lambda job: job.key):
+            digest.update(repr(job).encode())
+
+    return digest.hexdigest()
+
+
+class ReportManifest:
+    """Records, for each market report in an output directory, the digest of
+    the data and parameters it was made from (see `market_digest()`), so a
+    rerun can keep reports whose digest hasn't changed instead of rebuilding
+    them. Saved as `MANIFEST_NAME` in the output directory.
+    """
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        # Market -> {'digest': ..., 'file': ..., 'size': ...}
+        self.markets: dict[str, dict] = {}
+
+    @staticmethod
+    def load(output_dir: str) -> 'ReportManifest':
+        """Load the manifest of `output_dir`. A missing, unreadable or outdated
+        manifest is treated as empty, so every report is rebuilt.
+        """
+        manifest = ReportManifest(output_dir)
+        try:
+            with open(os.path.join(output_dir, MANIFEST_NAME)) as manifest_file:
+                contents = json.load(manifest_file)
+        except (OSError, ValueError):
+            return manifest
+
+        if isinstance(contents, dict) and contents.get('version') == REPORT_FORMAT_VERSION:
+            manifest.markets = contents.get('markets', {})
+
+        return manifest
+
+    def save(self) -> None:
+        """Write the manifest to the output directory. The file is replaced in
+        one step, so an interrupted save leaves the previous manifest intact.
+        """
+        manifest_path = os.path.join(self.output_dir, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump({'version': REPORT_FORMAT_VERSION, 'markets': self.markets}, manifest_file, indent=1)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def is_current(self, market: str, digest: str) -> bool:
+        """Whether the report of `market` was made from data and parameters with
+        `digest`, and is still in the output directory as it was written.
+        """
+        entry = self.markets.get(market)
+        if entry is None or entry['digest'] != digest:
+            return False
+
+        try:
+            return os.path.getsize(os.path.join(self.output_dir, entry['file'])) == entry['size']
+        except OSError:
+            return False
+
+    def record(self, market: str, digest: str, file_path: str) -> None:
+        """Record that the report of `market` at `file_path` was made from data
+        and parameters with `digest`.
+        """
+        self.markets[market] = {
+            'digest': digest,
+            'file': os.path.basename(file_path),
+            'size': os.path.getsize(file_path),
+        }
+
+    def discard(self, market: str) -> None:
+        """Remove the report of `market`, e.g., because it no longer has any
+        recommended venues, so that an outdated report isn't left behind.
+        """
+        entry = self.markets.pop(market, None)
+        if entry is None:
+            return
+
+        # A report that is open in Excel can't be removed; as it is no longer
+        # in the manifest, it will be rebuilt if the market returns
+        try:
+            os.remove(os.path.join(self.output_dir, entry['file']))
+        except OSError:
+            pass
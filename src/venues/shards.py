@@ -0,0 +1,125 @@
+import os
+import pickle
+import tempfile
+from datetime import datetime
+
+
+# Rows are spilled to disk in batches to keep pickling overhead low
+_BATCH_SIZE = 1000
+
+
+class MarketShard:
+    """The rows of one market from one input file, spilled to a temporary
+    file. Reads like a sheet (see `_extract_data()`), with the file's
+    headers as its first row, so each market can be extracted on its own.
+    """
+    def __init__(self, headers: list[str], path: str):
+        self.headers = headers
+        self.path = path
+        self.num_rows = 0
+
+    @property
+    def max_row(self) -> int:
+        return self.num_rows + 1
+
+    def iter_rows(self, min_row: int=1, values_only: bool=True):
+        """Yields a tuple of cell values for each row from `min_row` (1-based,
+        where row 1 holds the headers).
+        """
+        if min_row <= 1:
+            yield tuple(self.headers)
+
+        if self.num_rows == 0:
+            return
+
+        to_skip = max(min_row - 2, 0)
+        with open(self.path, 'rb') as spill_file:
+            while True:
+                try:
+                    batch = pickle.load(spill_file)
+                except EOFError:
+                    return
+
+                if to_skip >= len(batch):
+                    to_skip -= len(batch)
+                    continue
+
+                yield from batch[to_skip:]
+                to_skip = 0
+
+
+class ShardWriter:
+    """Partitions the rows of one input file by market into `MarketShard`s
+    in a single streaming pass, holding at most one batch per market in
+    memory.
+    """
+    def __init__(self, headers: list[str], directory: str, prefix: str):
+        self.headers = headers
+        self.directory = directory
+        self.prefix = prefix
+        self.shards: dict[str, MarketShard] = {}
+        self._batches: dict[str, list[tuple]] = {}
+        self._market_col = headers.index('MKT')
+
+    def add(self, row: tuple) -> None:
+        """Add a row to the shard of its market.
+        """
+        market = row[self._market_col]
+        # Markets are matched the same way venues are (see
+        # `VenueRecord.strip_field()`), so a missing market is ''
+        if market is None:
+            market = ''
+        elif isinstance(market, str):
+            market = market.strip()
+
+        batch = self._batches.get(market)
+        if batch is None:
+            path = os.path.join(self.directory, f'{self.prefix}_{len(self.shards)}.pkl')
+            self.shards[market] = MarketShard(self.headers, path)
+            batch = self._batches[market] = []
+
+        batch.append(row)
+        if len(batch) >= _BATCH_SIZE:
+            self._flush(market)
+
+    def close(self) -> dict[str, MarketShard]:
+        """Spill any remaining rows and return the shards by market.
+        """
+        for market in self._batches:
+            self._flush(market)
+        return self.shards
+
+    def _flush(self, market: str) -> None:
+        batch = self._batches[market]
+        if len(batch) == 0:
+            return
+
+        shard = self.shards[market]
+        with open(shard.path, 'ab') as spill_file:
+            pickle.dump(batch, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        shard.num_rows += len(batch)
+        batch.clear()
+
+
+class MarketShards:
+    """The input rows of a report, partitioned by market into temporary spill
+    files, and the cutoff date they are extracted with. Lets a report be run
+    a few markets at a time (see `SHARD_REPORT_WORKERS`), so peak memory
+    depends on the largest markets rather than on the whole data set.
+    """
+    def __init__(self):
+        self._directory = tempfile.TemporaryDirectory(prefix='datadirect_')
+        self.directory = self._directory.name
+        self.cutoff_date: datetime = None
+        # Each market's shards, one per input file the market appears in
+        self.by_market: dict[str, list[MarketShard]] = {}
+
+    @property
+    def markets(self) -> list[str]:
+        return sorted(self.by_market, key=str)
+
+    def add(self, file_shards: dict[str, MarketShard]) -> None:
+        """Add the shards partitioned from one input file.
+        """
+        for market, shard in file_shards.items():
+            self.by_market.setdefault(market, []).append(shard)
@@ -1,15 +1,34 @@
 from collections import defaultdict
 from datetime import datetime
-from typing import overload
-from dateutil.relativedelta import relativedelta
+from functools import cache
+from typing import TYPE_CHECKING, Iterable, Iterator, Union, overload
 import misc.ui as ui
-import openpyxl
 import os
-from tqdm import tqdm
 from venues.records import VenueRecord
-from venues.errors import HashError, NoValidSessionsException
-from openpyxl.styles import Border, Side, Alignment
-from openpyxl.styles import Font
+from venues.proximity import ProximityIndex, has_zip_centroids
+from venues.rejections import RejectionLedger
+from venues.report_manifest import ReportManifest, market_digest
+from venues.shards import MarketShard, MarketShards, ShardWriter
+from venues.report_context import ReportContext, ReportParameters
+from venues.errors import HashError, InvalidFieldError, MissingHeadersError, NoValidSessionsException
+
+# openpyxl, tqdm, dateutil and concurrent.futures are slow to import, so they are imported
+# where they are first used rather than here. This keeps program startup
+# (and the frozen executable's launch) fast.
+if TYPE_CHECKING:
+    from concurrent.futures import Future, ProcessPoolExecutor
+    import openpyxl
+
+# Input larger than this (in total) is processed one market at a time
+SHARD_THRESHOLD_BYTES = 64 * 1024 * 1024
+# Number of markets processed at once when sharded. Peak memory is about
+# this many times that of the largest market.
+SHARD_REPORT_WORKERS = 2
+
+# A spreadsheet row as read by `_parse_rows()`: its row number, the earliest
+# date in it (`None` if it has none), and either the venue it describes,
+# with the row's job, or the `(reason, Job#, column)` it was rejected for.
+ParsedRow = tuple[int, Union[datetime, None], Union[VenueRecord, tuple[str, object, str]]]
 
 expected_headers = [
             'Job#', 'User', 'MKT', 'LOC#', 'Week', 'Zone', 'Restaurant',
@@ -26,29 +45,45 @@ expected_headers = [
 @overload
 def generate() -> None: ...
 @overload
-def generate(venue_records: set['VenueRecord']) -> None: ...
+def generate(venue_records: set['VenueRecord'], rejections: RejectionLedger) -> None: ...
+@overload
+def generate(*, shards: MarketShards) -> None: ...
 
-def generate(venue_records: set['VenueRecord']=None):
+def generate(venue_records: set['VenueRecord']=None, rejections: RejectionLedger=None, shards: MarketShards=None):
     print('\n[Begin new report]')
-    if (venue_records is None):
+    pending_ingest = None
+    pending_partition = None
+    if (venue_records is None and shards is None):
         # Display logotype intro
         ui.hideCursor()
-        ui.prompt_user('\nThis program will now prompt you to select an Excel (.xlsx) file containing venue data. Press any key to continue.')
-        ui.pause()
-
-        # Prompt for excel file
-        file_path = _get_file_path(test=False)
-
-        # Load file
-        headers, raw_data_sheet = _load_excel(file_path)
+        ui.prompt_user('\nThis program will now prompt you to select one or more Excel (.xlsx) files, or a folder of them, containing venue data.')
+
+        # Prompt for excel files
+        file_paths = _get_file_paths(test=False)
+
+        # Start loading and extracting in the background with the default
+        # cutoff date so that the parse overlaps with the questions below.
+        # Large data sets are instead partitioned by market, and each market
+        # is extracted later on its own, which bounds peak memory.
+        from dateutil.relativedelta import relativedelta
+        default_cutoff = datetime.now() - relativedelta(months=16)
+        if _should_shard(file_paths):
+            print('The selected data is large, so it will be processed one market at a time.')
+            shards, pending_partition = _begin_partition(file_paths)
+        else:
+            pending_ingest = _begin_ingest(file_paths, default_cutoff)
         
         cutoff_date = ui.query_date(
             'Data Set Cutoff Date (MM/DD/YY): ',
-            default=datetime.now() - relativedelta(months=16))
-        
-        print('Extracting data. This may take a minute...')
-        venue_records = _extract_data(headers, raw_data_sheet, cutoff_date)
-        ui.print_success('Extraction complete.')
+            default=default_cutoff)
+
+        # An earlier cutoff includes rows the background load skipped, so
+        # those are read as well. (A later cutoff only drops rows, and
+        # partitioning doesn't depend on the cutoff.)
+        if pending_ingest is not None and cutoff_date < default_cutoff:
+            pending_ingest = _reextract(pending_ingest, default_cutoff, cutoff_date)
+        if shards is not None:
+            shards.cutoff_date = cutoff_date
 
 
     # ----- QUERY USER FOR PARAMETERS -----
@@ -69,6 +104,10 @@ def generate(venue_records: set['VenueRecord']=None):
     print('\nFor default values on any of the following questions, continue without entering anything.')
     # Query saturation period
     saturation_period = ui.query_int('Zone Saturation Period (weeks): ', 16)
+    # Query saturation radius, if venue locations are known
+    saturation_radius = 0
+    if has_zip_centroids():
+        saturation_radius = ui.query_float('Zone Saturation Radius (miles, 0 for zone only): ', 0)
     # Query for the "around the same time period"
     prox_weeks = ui.query_int('Scheduling Period Lookback Margin (weeks): ', 2)
     # Query minimum RSVPs
@@ -82,25 +121,22 @@ def generate(venue_records: set['VenueRecord']=None):
     print('\nFor specific markets, use market codes separated by spaces (e.g., "HOU PDX...")')
     markets = ui.query_user('Specific Markets: ').split(' ')
 
-    # Exclude venues...
-    # 1. Whose last RSVPs do not meet min_rsvps, and
-    # 2. Who are in a zone which has had a job within the last four months
-    # TODO this comment is wrong; it needs to be updated to reflect actual logic
-
-    print('Executing set exclusions...')
-    # We want to exclude all zones that have had an event within four months
-    filtered_data = _filter_data(venue_records, saturation_period, start_date, min_rsvps, min_ror)
+    params = ReportParameters(
+        start_date=start_date, end_date=end_date,
+        saturation_period=saturation_period, prox_weeks=prox_weeks,
+        min_rsvps=min_rsvps, min_ror=min_ror, num_venues=num_venues,
+        saturation_radius=saturation_radius)
 
-    # Split venues into those who had a job around the same time last year, and those that didn't
-    # sort the proximal venues by ROR
-    # sort the non-proximal venues first by oldest last job month
-    # and then by ROR
-    print('Performing optimizations...')
+    # Wait for the background load, if one is running
+    if pending_ingest is not None:
+        venue_records, rejections = _await_ingest(pending_ingest, cutoff_date)
+    if pending_partition is not None:
+        _await_partition(pending_partition, shards)
 
-    # Rank venues
-    sorted_data = _sort_data(filtered_data, start_date, end_date, prox_weeks)
-
-    ui.print_success('Exclusions and optimizations complete.')
+    # In sharded mode, each market is instead extracted, filtered,
+    # ranked and written on its own once the output directory is known.
+    if shards is None:
+        sorted_data, context = _rank_venues(venue_records, params)
 
     # Prepare to output data
     ui.prompt_user('\nThis program will now prompt you to select an ouput directory. Press any key to continue.')
@@ -111,158 +147,621 @@ def generate(venue_records: set['VenueRecord']=None):
 
     if selected_dir == '':
         ui.print_error('No directory selected. Terminating report.')
-        generate(venue_records)
+        generate(venue_records, rejections, shards)
         return
 
     print('Creating output directory...')
     output_dir = selected_dir + f'\\VEN_REPORT_{start_date.strftime("%m_%d_%y")}-{end_date.strftime("%m_%d_%y")}'
 
-    # Check if directory already exists, and if so warn user. 
+    # If the directory already exists, reports in it are updated: those
+    # made from the same data and parameters are kept (see ReportManifest).
+    if os.path.isdir(output_dir):
+        print('A venues report folder with the same name already exists at the selected location. Market reports whose data and settings have not changed will be kept.')
+
     try:
-        os.makedirs(output_dir, exist_ok=False)
+        os.makedirs(output_dir, exist_ok=True)
     except OSError:
-        ui.print_warning('WARNING: A venues report folder with the same name already exists at the selected location. Please move it or select a different directory. This report will terminate.')
-        generate(venue_records)
+        ui.print_error('The output directory could not be created. This report will terminate.')
+        generate(venue_records, rejections, shards)
         return
 
-    print('Classifying records by market...')
-    venues_by_market = defaultdict(list[VenueRecord])
-    for venue in sorted_data:
-        venues_by_market[venue.market].append(venue)
+    manifest = ReportManifest.load(output_dir)
+
+    if shards is not None:
+        rejections, num_written, num_kept = _write_sharded_reports(shards, output_dir, manifest, markets, params)
+        data_markets = set(shards.markets)
+    else:
+        print('Classifying records by market...')
+        venues_by_market = defaultdict(list[VenueRecord])
+        for venue in sorted_data:
+            venues_by_market[venue.market].append(venue)
+
+        # A market's report depends on all of its venues, not just the ranked ones
+        market_venues = defaultdict(list[VenueRecord])
+        for venue in venue_records:
+            market_venues[venue.market].append(venue)
+        
+        data_markets = set(market_venues)
+
+        print('Writing records to new files...')
+        num_written = 0
+        num_kept = 0
+        # Write to new excel file
+        for market in market_venues:
+            # If user requested specific markets, halt for non-specified markets
+            if markets[0] != '' and market not in markets:
+                continue
+
+            if market not in venues_by_market:
+                manifest.discard(market)
+                continue
+
+            try:
+                if _update_market_report(manifest, output_dir, market, market_venues[market], venues_by_market[market], context):
+                    num_written += 1
+                else:
+                    num_kept += 1
+            except OSError as e:
+                _report_save_error(market, e)
+
+    # Remove the reports of requested markets that are no longer in the data
+    for market in list(manifest.markets):
+        if market not in data_markets and (markets[0] == '' or market in markets):
+            manifest.discard(market)
+
+    manifest.save()
+    if num_kept > 0:
+        print(f'{num_written} market report(s) written; {num_kept} unchanged report(s) kept.')
+
+    # Summarize the source rows that were skipped during extraction
+    rejections_path = os.path.join(output_dir, 'REJECTED_ROWS.csv')
+    if rejections is not None and rejections.total > 0:
+        rejections.write(rejections_path)
+    elif os.path.exists(rejections_path):
+        os.remove(rejections_path)
+
+    ui.print_success(f"Report(s) have been saved. Press any key to begin a new report, or close the program.")
+    ui.pause()
     
-    print('Writing records to new files...')
-    # Write to new excel file
-    for market, venues in venues_by_market.items():
-        # If user requested specific markets, halt for non-specified markets
-        if markets[0] != '' and market not in markets:
-            continue
+    generate(venue_records, rejections, shards)
+    return
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
 
-        # IMPORTANT if headers are changed, then the returned tuple
-        # from Venue.to_entry() must also be changed so that the header
-        # order matches the data order.
-        headers = [
-            'Job#', 'User', 'MKT', 'LOC#', 'Week', 
 
-            'Zone', 'Zone/Last', 'Last Venue', 'ROR%', 
-            
-            'Recommended Venue', 'St Address', 'City', 'ST', 'ZIP', 
-            'Mail Piece', 'Qty', 'Venue/Last', '# Sessions',  
-            'Session Type', 'RSVPs', 'RMI', 'ROR%', 
-            
-            'Venue/Qualifier',  'RSVPs', 'ROR%', 
-            
-            'Zone Use', 'Average ROR%']
+# ===== internal helper functions ===== #
 
-        ws.append(headers)
 
-        # This is for capping number of written venues
-        i = 0
-        # And this is for tracking which zones we've already written
-        # venues for. We only want a maximum of one venue per zone
-        # per market.
-        used_zones: set[str] = set()
 
-        for venue in venues:
-            if (i < num_venues 
-                and venue.zone not in used_zones):
-                
-                row = venue.to_entry(start_date, end_date, prox_weeks, venue_records)
-                ws.append(row)
-                i += 1
-                used_zones.add(venue.zone)
+def _rank_venues(venue_records: set[VenueRecord], params: ReportParameters) -> tuple[list[VenueRecord], ReportContext]:
+    """Filters and sorts venues for a report with `params`, returning the
+    ranked venues and the report context used to write them.
+    """
+    # Exclude venues...
+    # 1. Whose last RSVPs do not meet min_rsvps, and
+    # 2. Who are in a zone which has had a job within the last four months
+    # TODO this comment is wrong; it needs to be updated to reflect actual logic
+
+    # Thresholds and per-venue results shared by filtering, sorting and writing
+    context = ReportContext(venue_records, params)
+
+    print('Executing set exclusions...')
+    # We want to exclude all zones that have had an event within four months
+    filtered_data = _filter_data(venue_records, context)
+
+    # Split venues into those who had a job around the same time last year, and those that didn't
+    # sort the proximal venues by ROR
+    # sort the non-proximal venues first by oldest last job month
+    # and then by ROR
+    print('Performing optimizations...')
 
-        _style_workbook(wb)
+    # Rank venues
+    sorted_data = _sort_data(filtered_data, context)
 
-        file_path = os.path.join(output_dir, f'{market}_{start_date.strftime("%m_%d_%y")}-{end_date.strftime("%m_%d_%y")}.xlsx')
+    ui.print_success('Exclusions and optimizations complete.')
 
-        wb.save(file_path)
+    return (sorted_data, context)
 
-    ui.print_success(f"Report(s) have been saved. Press any key to begin a new report, or close the program.")
-    ui.pause()
-    
-    generate(venue_records)
-    return
 
+def _update_market_report(manifest: ReportManifest, output_dir: str, market: str, market_venues: list[VenueRecord], venues: list[VenueRecord], context: ReportContext) -> bool:
+    """Write the report of one market from its ranked `venues`, unless
+    `manifest` shows the report in `output_dir` was made from the same
+    `market_venues` (all of the market's venues) and report parameters, and
+    record it in `manifest`. Returns whether the report was written.
 
+    Raises an `OSError` if the report can't be saved, e.g. because it is open
+    in Excel. The market is then dropped from `manifest`, as its report may
+    be outdated, so that the next run rebuilds it.
+    """
+    digest = market_digest(market_venues, context.params)
+    if manifest.is_current(market, digest):
+        return False
 
-# ===== internal helper functions ===== #
+    try:
+        file_path = _write_market_report(output_dir, market, venues, context)
+    except OSError:
+        manifest.markets.pop(market, None)
+        raise
+    manifest.record(market, digest, file_path)
+    return True
+
+
+def _report_save_error(market: str, e: OSError):
+    """Display the UI warning for a market report that couldn't be saved.
+    """
+    file_name = os.path.basename(e.filename) if e.filename is not None else f'the {market} report'
+    ui.print_warning(f'Could not save {file_name} ({e.strerror or e}). If it is open in Excel, '
+                     'close it and run the report again to update it.')
+
+
+def _write_market_report(output_dir: str, market: str, venues: list[VenueRecord], context: ReportContext) -> str:
+    """Write the ranked `venues` of one market to a new, styled workbook in
+    `output_dir`, and return its path.
+    """
+    import openpyxl
+    wb = openpyxl.Workbook()
+    ws = wb.active
+
+    # IMPORTANT if headers are changed, then the returned tuple
+    # from Venue.to_entry() must also be changed so that the header
+    # order matches the data order.
+    headers = [
+        'Job#', 'User', 'MKT', 'LOC#', 'Week', 
+
+        'Zone', 'Zone/Last', 'Last Venue', 'ROR%', 
+        
+        'Recommended Venue', 'St Address', 'City', 'ST', 'ZIP', 
+        'Mail Piece', 'Qty', 'Venue/Last', '# Sessions',  
+        'Session Type', 'RSVPs', 'RMI', 'ROR%', 
+        
+        'Venue/Qualifier',  'RSVPs', 'ROR%', 
+        
+        'Zone Use', 'Average ROR%']
+
+    ws.append(headers)
 
+    # This is for capping number of written venues
+    i = 0
+    # And this is for tracking which zones we've already written
+    # venues for. We only want a maximum of one venue per zone
+    # per market.
+    used_zones: set[str] = set()
+
+    for venue in venues:
+        if (i < context.params.num_venues 
+            and venue.zone not in used_zones):
+            
+            row = venue.to_entry(context)
+            ws.append(row)
+            i += 1
+            used_zones.add(venue.zone)
+
+    _style_workbook(wb)
+
+    start_date, end_date = context.params.start_date, context.params.end_date
+    file_path = os.path.join(output_dir, f'{market}_{start_date.strftime("%m_%d_%y")}-{end_date.strftime("%m_%d_%y")}.xlsx')
+
+    wb.save(file_path)
+
+    return file_path
 
 
-def _get_file_path(test: bool=False) -> str:
-    """Query the user for a filepath and returns a string. Will cause a UI
-    error and exit if the user enters an empty string.
+def _get_file_paths(test: bool=False) -> list[str]:
+    """Query the user for one or more files, or a directory of files, and
+    return a list of file paths. Will cause a UI error and exit if the user
+    selects nothing.
     """
     if test:
-        file_path = 'C:\\Users\\alexc\\Documents\\data-direct\\test\\test_input.xlsx'
+        return ['C:\\Users\\alexc\\Documents\\data-direct\\test\\test_input.xlsx']
+
+    ui.showCursor()
+    choice = ui.query_user('Select individual (F)iles or a (D)irectory of files? [F]: ', 'F')
+    ui.hideCursor()
+
+    if choice.strip().upper().startswith('D'):
+        directory = ui.promptDirectory()
+        # Skip the lock files Excel creates for open workbooks
+        file_paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith('.xlsx') and not name.startswith('~$')
+        ) if directory != '' else []
     else:
-        file_path = ui.promptFile((('Excel Spreadsheet', ('*.xlsx')),('All files', '*.*')))
+        file_paths = list(ui.promptFiles((('Excel Spreadsheet', ('*.xlsx')),('All files', '*.*'))))
 
-
-    # Validate file path
-    if file_path == '':
+    # Validate file paths
+    if len(file_paths) == 0:
         ui.print_error('No file was selected.')
         ui.pause()
         ui.exit()
-    
-    return file_path
 
+    print(f'{len(file_paths)} file(s) selected.')
+    return file_paths
 
-def _load_excel(excel_file_path: str) -> list:
-    """Attempt to load an excel spreadsheet and return a list which
-    can be iterated over. Will cause a UI error if an exception occurs or
-    the file is missing necessary file headers, which are hardcoded in this
-    class.
+
+def _read_excel(excel_file_path: str) -> tuple[list[str], list]:
+    """Load an excel spreadsheet and return its headers and active sheet.
+    Raises a `MissingHeadersError` if the sheet is missing any of the
+    expected headers. Does not interact with the UI, so it is safe to call
+    from a background thread.
+
+    The sheet is read with the streaming reader in `misc.xlsx_reader`, which
+    is much faster than openpyxl. openpyxl is used instead if the streaming
+    reader fails, whether on opening the file or partway through its rows
+    (see `_FallbackSheet`).
     """
+    from misc import xlsx_reader
     try:
-        # Read file with openpyxl
-        print('Loading Excel file...')
-        workbook = openpyxl.load_workbook(excel_file_path, data_only=True)
-        sheet = workbook.active
-        headers = [cell.value for cell in sheet[1]]
-       
-        missing_headers = [exp_hdr for exp_hdr in expected_headers if exp_hdr not in headers]
-        # If there are missing headers
-        if len(missing_headers) > 0:
+        sheet = _FallbackSheet(excel_file_path, xlsx_reader.open_sheet(excel_file_path))
+    except Exception:
+        sheet = _open_openpyxl_sheet(excel_file_path)
+
+    headers = list(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ()))
+
+    missing_headers = [exp_hdr for exp_hdr in expected_headers if exp_hdr not in headers]
+    if len(missing_headers) > 0:
+        raise MissingHeadersError(missing_headers)
+
+    return (headers, sheet)
+
+
+def _open_openpyxl_sheet(excel_file_path: str):
+    import openpyxl
+    workbook = openpyxl.load_workbook(excel_file_path, data_only=True)
+    return workbook.active
+
+
+class _FallbackSheet:
+    """A sheet read with the streaming reader that switches to openpyxl if the
+    reader fails on a row, continuing from that row. Rows already yielded
+    are not read again.
+    """
+    def __init__(self, file_path: str, sheet):
+        self.file_path = file_path
+        self.sheet = sheet
+
+    @property
+    def max_row(self) -> int:
+        return self.sheet.max_row
+
+    def iter_rows(self, min_row: int=1, max_row: int=None, values_only: bool=True):
+        row_num = min_row
+        try:
+            for row in self.sheet.iter_rows(min_row=min_row, max_row=max_row, values_only=values_only):
+                yield row
+                row_num += 1
+            return
+        except Exception:
+            from misc.xlsx_reader import XlsxSheet
+            if not isinstance(self.sheet, XlsxSheet):
+                raise
+
+        self.sheet = _open_openpyxl_sheet(self.file_path)
+        yield from self.sheet.iter_rows(min_row=row_num, max_row=max_row, values_only=values_only)
+
+
+def _report_load_error(e: BaseException, file_path: str=None):
+    """Display the UI error for a failed spreadsheet load and exit.
+    """
+    file_name = os.path.basename(file_path) if file_path is not None else None
+
+    # If there are missing headers
+    if isinstance(e, MissingHeadersError):
+        if file_name is not None:
+            missing_headers_msg = f'The file {file_name} is missing the following expected columns:'
+        else:
             missing_headers_msg = 'The selected file is missing the following expected columns:'
-            for header in missing_headers:
-                missing_headers_msg += f'\n{header}'
-            ui.print_error(missing_headers_msg)
-            ui.pause()
-            ui.exit()
+        for header in e.missing_headers:
+            missing_headers_msg += f'\n{header}'
+        ui.print_error(missing_headers_msg)
+    elif file_name is not None:
+        ui.print_error(f'An error occured while reading the file {file_name}. This is likely due to invalid file format.')
+    else:
+        ui.print_error(f'An error occured while reading the file. This is likely due to invalid file format.')
+    ui.pause()
+    ui.exit()
+
+
+def _ingest_file(excel_file_path: str, cutoff_date: datetime, before: datetime=None) -> list[ParsedRow]:
+    """Load and parse a single spreadsheet, returning its rows that are not
+    outdated at `cutoff_date` (and, if `before` is given, only those that
+    are outdated at `before`). Runs in a worker process.
+    """
+    headers, sheet = _read_excel(excel_file_path)
+    return list(_parse_rows(headers, sheet, cutoff_date, before, progress=False))
+
+
+def _begin_ingest(file_paths: list[str], cutoff_date: datetime) -> list[tuple[str, list['Future']]]:
+    """Start loading and parsing each spreadsheet concurrently on the worker
+    pool. Returns, for each file, its path and the futures of its parsed
+    rows (see `_ingest_file()`).
+    """
+    pool = _get_worker_pool()
+    return [(file_path, [pool.submit(_ingest_file, file_path, cutoff_date)]) for file_path in file_paths]
+
+
+def _reextract(pending_ingest: list[tuple[str, list['Future']]], ingest_cutoff: datetime, cutoff_date: datetime) -> list[tuple[str, list['Future']]]:
+    """Extend a pending ingest started with `ingest_cutoff` to an earlier
+    `cutoff_date`. Files that haven't started loading yet are restarted with
+    `cutoff_date`. Files that have already started can't be stopped, so
+    their rows are kept and only the rows the earlier cutoff adds are read.
+    """
+    pool = _get_worker_pool()
+    reextracted = []
+    for file_path, futures in pending_ingest:
+        if all(future.cancel() for future in futures):
+            futures = [pool.submit(_ingest_file, file_path, cutoff_date)]
         else:
-            ui.print_success('All expected headers are present.')
+            futures = futures + [pool.submit(_ingest_file, file_path, cutoff_date, ingest_cutoff)]
+        reextracted.append((file_path, futures))
+
+    return reextracted
+
+
+def _await_ingest(pending_ingest: list[tuple[str, list['Future']]], cutoff_date: datetime) -> tuple[set['VenueRecord'], RejectionLedger]:
+    """Wait for a background ingest to finish and return its venue records,
+    extracted with `cutoff_date` and merged across files, and the ledger of
+    rows it skipped. Will cause a UI error and exit if loading any file
+    failed.
+    """
+    if not all(future.done() for _, futures in pending_ingest for future in futures):
+        print('Extracting data. This may take a minute...')
+
+    results = []
+    for file_path, futures in pending_ingest:
+        try:
+            results.append([future.result() for future in futures])
+        except BaseException as e:
+            _report_load_error(e, file_path)
+
+    venue_records, rejections = _fold_ingests(results, cutoff_date)
+
+    ui.print_success('Extraction complete.')
+
+    duplicate_jobs = sum(venue.duplicate_jobs for venue in venue_records)
+    if duplicate_jobs > 0:
+        print(f'{duplicate_jobs} duplicate job row(s) were merged.')
+
+    if rejections.total > 0:
+        ui.print_warning(f'{rejections.total} row(s) could not be read and were skipped. '
+                         'A summary will be saved with the report.')
+
+    return (venue_records, rejections)
+
+
+def _fold_ingests(results: list[list[list[ParsedRow]]], cutoff_date: datetime) -> tuple[set['VenueRecord'], RejectionLedger]:
+    """Extract the venue records of each file from its parsed rows with
+    `cutoff_date`, and merge them across files (see `_merge_ingests()`).
+    A file's rows may have been read in several parts (see `_reextract()`);
+    the parts are folded together in file order.
+    """
+    import heapq
+
+    file_results = []
+    for file_parts in results:
+        rejections = RejectionLedger()
+        venue_records = _fold_rows(heapq.merge(*file_parts, key=lambda row: row[0]), cutoff_date, rejections)
+        file_results.append((venue_records, rejections))
+
+    return _merge_ingests(file_results)
+
+
+def _merge_ingests(results: list[tuple[set['VenueRecord'], RejectionLedger]]) -> tuple[set['VenueRecord'], RejectionLedger]:
+    """Merge the venue records and rejection ledgers extracted from several
+    files. Venues are matched by identity key, and their jobs deduplicated,
+    as if all rows had come from one file.
+    """
+    venues_by_key: dict[tuple, VenueRecord] = {}
+    rejections = RejectionLedger()
+
+    for file_venues, file_rejections in results:
+        rejections.merge(file_rejections)
+
+        for venue in file_venues:
+            existing_venue = venues_by_key.get(venue.key)
+            if existing_venue is None:
+                venues_by_key[venue.key] = venue
+                continue
+
+            existing_venue.duplicate_jobs += venue.duplicate_jobs
+            for job in venue.job_records:
+                existing_venue.add_job(job)
+
+    return (set(venues_by_key.values()), rejections)
+
+
+def _should_shard(file_paths: list[str]) -> bool:
+    """Whether the input files are large enough to be processed one market at
+    a time rather than all at once.
+    """
+    return sum(os.path.getsize(file_path) for file_path in file_paths) > SHARD_THRESHOLD_BYTES
+
+
+def _partition_file(excel_file_path: str, directory: str, prefix: str) -> dict[str, MarketShard]:
+    """Load a spreadsheet and partition its rows by market into shards in
+    `directory`, returning them by market. Runs in a worker process.
+    """
+    headers, sheet = _read_excel(excel_file_path)
+    writer = ShardWriter(headers, directory, prefix)
+    for row in sheet.iter_rows(min_row=2, values_only=True):
+        writer.add(row)
+
+    return writer.close()
 
-    except BaseException as e:
-        ui.print_error(f'An error occured while reading the file. This is likely due to invalid file format.')
-        ui.pause()
-        ui.exit()
-    
-    return (headers, sheet)
 
+def _begin_partition(file_paths: list[str]) -> tuple[MarketShards, list[tuple[str, 'Future']]]:
+    """Start partitioning each spreadsheet by market concurrently on the worker
+    pool. Returns the (still empty) shards and a `(file_path, future)` pair
+    per file; see `_await_partition()`.
+    """
+    shards = MarketShards()
+    pool = _get_worker_pool()
+    pending_partition = [
+        (file_path, pool.submit(_partition_file, file_path, shards.directory, str(i)))
+        for i, file_path in enumerate(file_paths)
+    ]
+
+    return (shards, pending_partition)
+
+
+def _await_partition(pending_partition: list[tuple[str, 'Future']], shards: MarketShards):
+    """Wait for background partitioning to finish and add each file's shards
+    to `shards`. Will cause a UI error and exit if loading any file failed.
+    """
+    if not all(future.done() for _, future in pending_partition):
+        print('Partitioning data by market. This may take a minute...')
+
+    for file_path, future in pending_partition:
+        try:
+            shards.add(future.result())
+        except BaseException as e:
+            _report_load_error(e, file_path)
+
+    ui.print_success(f'Partitioned data into {len(shards.markets)} market(s).')
+
+
+def _report_market(market: str, market_shards: list[MarketShard], cutoff_date: datetime, params: ReportParameters, output_dir: str, manifest: ReportManifest) -> tuple[RejectionLedger, int, Union[dict, None], bool, Union[OSError, None]]:
+    """Extract, filter, rank and write the report of a single market from its
+    shards. Every step of a report is scoped to one market, so this gives the
+    same result as running the report on all markets at once. Runs in a
+    worker process, with a copy of `manifest`. Returns the rows skipped, the
+    number of duplicate job rows merged, the market's new manifest entry,
+    whether its report was written and the error that kept it from being
+    saved, if any.
+    """
+    results = []
+    for shard in market_shards:
+        rejections = RejectionLedger()
+        venue_records = _extract_data(shard.headers, shard, cutoff_date, progress=False, rejections=rejections)
+        results.append((venue_records, rejections))
+    venue_records, rejections = _merge_ingests(results)
+
+    context = ReportContext(venue_records, params)
+    sorted_data = _sort_data(_filter_data(venue_records, context), context)
+
+    # Like in a full report, markets with no recommended venues get no file
+    written = False
+    save_error = None
+    if len(sorted_data) > 0:
+        try:
+            written = _update_market_report(manifest, output_dir, market, venue_records, sorted_data, context)
+        except OSError as e:
+            save_error = e
+    else:
+        manifest.discard(market)
 
-def _extract_data(headers: list[str], raw_data_sheet: list, cutoff_date: datetime) -> set['VenueRecord']:
-    """Accepts a data sheet like one from an openpyxl workbook and retrns
+    duplicate_jobs = sum(venue.duplicate_jobs for venue in venue_records)
+    return (rejections, duplicate_jobs, manifest.markets.get(market), written, save_error)
+
+
+def _write_sharded_reports(shards: MarketShards, output_dir: str, manifest: ReportManifest, markets: list[str], params: ReportParameters) -> tuple[RejectionLedger, int, int]:
+    """Write the report of each market in `shards` (or only those in `markets`,
+    if any are given) with `params` on the worker pool, keeping unchanged reports and
+    updating `manifest`. At most `SHARD_REPORT_WORKERS` markets are in
+    memory at once. Returns the rows skipped across all markets, the number
+    of reports written and the number of unchanged reports kept.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+    from tqdm import tqdm
+
+    report_markets = [market for market in shards.markets if markets[0] == '' or market in markets]
+
+    print(f'Writing records for {len(report_markets)} market(s) to new files...')
+    pool = _get_worker_pool()
+    pending_markets = iter(report_markets)
+    running: dict['Future', str] = {}
+
+    def submit_next():
+        market = next(pending_markets, None)
+        if market is not None:
+            future = pool.submit(_report_market, market, shards.by_market[market], shards.cutoff_date,
+                                 params, output_dir, manifest)
+            running[future] = market
+
+    for _ in range(SHARD_REPORT_WORKERS):
+        submit_next()
+
+    rejections = RejectionLedger()
+    duplicate_jobs = 0
+    num_written = 0
+    num_kept = 0
+    save_errors: list[tuple[str, OSError]] = []
+    with tqdm(total=len(report_markets)) as progress:
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                market = running.pop(future)
+                submit_next()
+
+                market_rejections, market_duplicate_jobs, manifest_entry, written, save_error = future.result()
+                if save_error is not None:
+                    save_errors.append((market, save_error))
+                rejections.merge(market_rejections)
+                duplicate_jobs += market_duplicate_jobs
+                num_written += written
+                num_kept += manifest_entry is not None and not written
+                # Each worker updated its own copy of the manifest
+                if manifest_entry is None:
+                    manifest.markets.pop(market, None)
+                else:
+                    manifest.markets[market] = manifest_entry
+                progress.update()
+
+    # Shown once the progress bar is done, so they don't break it up
+    for market, save_error in save_errors:
+        _report_save_error(market, save_error)
+
+    if duplicate_jobs > 0:
+        print(f'{duplicate_jobs} duplicate job row(s) were merged.')
+
+    if rejections.total > 0:
+        ui.print_warning(f'{rejections.total} row(s) could not be read and were skipped.')
+
+    return (rejections, num_written, num_kept)
+
+
+_worker_pool: 'ProcessPoolExecutor' = None
+
+def _get_worker_pool() -> 'ProcessPoolExecutor':
+    """Returns the pool of worker processes used for ingesting spreadsheets.
+    Processes rather than threads are used so that files are parsed in
+    parallel.
+    """
+    global _worker_pool
+    if _worker_pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+        # Windows doesn't support more than 61 worker processes
+        _worker_pool = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 61))
+    return _worker_pool
+
+
+def _extract_data(headers: list[str], raw_data_sheet: list, cutoff_date: datetime, progress: bool=True, rejections: RejectionLedger=None) -> set['VenueRecord']:
+    """Accepts a data sheet like one from an openpyxl workbook (or an `XlsxSheet`) and retrns
     a set of VenueRecords. Will skip over malformed entries in the sheet
-    without raising any exceptions.
+    without raising any exceptions, recording them in `rejections` if given.
+    Set `progress` to `False` to hide the progress bar (e.g., when running in
+    the background).
     """
-    venue_records: set[VenueRecord] = set()
-    # Load data into structures
-    # Iterate through each entry
-    for entry in tqdm(raw_data_sheet.iter_rows(min_row=2, values_only=True), total=raw_data_sheet.max_row - 1):
-        # If entry contains a date before cutoff date, don't evaluate
-        outdated = False
-        for val in entry:
-            try:
-                if val < cutoff_date:
-                    outdated = True
-                    break
-            except:
-                pass
-        if outdated:
+    if rejections is None:
+        rejections = RejectionLedger()
+
+    return _fold_rows(_parse_rows(headers, raw_data_sheet, cutoff_date, progress=progress), cutoff_date, rejections)
+
+
+def _parse_rows(headers: list[str], raw_data_sheet: list, cutoff_date: datetime, before: datetime=None, progress: bool=True) -> Iterator[ParsedRow]:
+    """Yields each row of a data sheet that is not outdated at `cutoff_date`
+    (i.e., has no date before it), parsed into a venue or a rejection. If
+    `before` is given, only rows that are outdated at `before` are yielded.
+    Rows without a Job# are skipped.
+    """
+    from tqdm import tqdm
+
+    total = raw_data_sheet.max_row - 1 if raw_data_sheet.max_row is not None else None
+    for row_num, entry in enumerate(tqdm(raw_data_sheet.iter_rows(min_row=2, values_only=True), total=total, disable=not progress), start=2):
+        # A row is outdated at a cutoff date if it contains a date before it.
+        # (Dates with a time zone can't be compared with the cutoff.)
+        oldest = min((val for val in entry if isinstance(val, datetime) and val.tzinfo is None), default=None)
+        if oldest is not None and oldest < cutoff_date:
+            continue
+        if before is not None and (oldest is None or oldest >= before):
             continue
 
         # Convert tuple to dict so we can reference by key
@@ -274,65 +773,94 @@ def _extract_data(headers: list[str], raw_data_sheet: list, cutoff_date: datetim
 
         # Create a new venue (or at least try to)
         try:
-            new_venue = VenueRecord.from_entry(entry)
-            found = False
-            # And check if it matches an existing venue
-            for existing_venue in venue_records:
-                # If there is a match
-                if new_venue == existing_venue:
-                    # Add new job record to existing venue
-                    existing_venue.add_job_record(entry)  
-                    found = True
-
-            # If no matching venue found, add this one to the set
-            if not found:
-                venue_records.add(new_venue)
+            parsed = VenueRecord.from_entry(entry)
 
+        # Printing a warning per row is too slow and too verbose,
+        # so skipped rows are counted in the ledger instead.
         except NoValidSessionsException:
-            #tqdm.write(ui.warning(f'No valid sessions found for job {entry['Job#']}. Skipping this job.'))
-            pass
+            parsed = (RejectionLedger.NO_VALID_SESSIONS, entry['Job#'], '')
+
+        except InvalidFieldError as e:
+            parsed = (RejectionLedger.INVALID_VALUE, entry['Job#'], e.column)
 
         except (TypeError, ValueError) as e:
-            #if entry['Job#'] is not None:
-            #    tqdm.write(ui.warning(f'Job {entry['Job#']} is invalidly formatted. Skipping this job.'))
-            pass
+            parsed = (RejectionLedger.INVALID_VALUE, entry['Job#'], '')
 
         except (HashError) as e:
-            pass
+            parsed = (RejectionLedger.NO_STREET_NUMBER, entry['Job#'], 'St Address')
 
-        #except BaseException:
-        #    if entry['Job#'] is not None:
-        #        #ui.print_warning(f'Job {entry['Job#']} is invalidly formatted. Skipping job.')
-        #        # TODO - printing a warning is too verbose. Maybe do something else?
-        #        pass
+        yield (row_num, oldest, parsed)
 
-    return venue_records
 
+def _fold_rows(parsed_rows: Iterable[ParsedRow], cutoff_date: datetime, rejections: RejectionLedger) -> set['VenueRecord']:
+    """Folds parsed rows, in file order, into a set of VenueRecords, skipping
+    rows that are outdated at `cutoff_date` and recording rejected rows in
+    `rejections`. Rows of the same venue are merged into one record, and
+    duplicate jobs keep their first row.
+    """
+    # Venues by identity key, so matching rows to venues is a dict lookup
+    venues_by_key: dict[tuple, VenueRecord] = {}
+    for _, oldest, parsed in parsed_rows:
+        if oldest is not None and oldest < cutoff_date:
+            continue
+
+        if not isinstance(parsed, VenueRecord):
+            rejections.reject(*parsed)
+            continue
+
+        # Check if it matches an existing venue
+        existing_venue = venues_by_key.get(parsed.key)
+        if existing_venue is not None:
+            # Add new job record to existing venue. Duplicate
+            # jobs are folded into the one already recorded.
+            existing_venue.add_job(next(iter(parsed.job_records)))
+        else:
+            # If no matching venue found, add this one
+            venues_by_key[parsed.key] = parsed
+
+    return set(venues_by_key.values())
 
-def _filter_data(venue_records: set[VenueRecord], saturation_period: int, start_date: datetime, min_rsvps: int, min_ror: float):
-    """Filters out undesirable venues. The current criteria is based on minimum
-    number of RSVPs and whether a venue's zone has had a seminar within the `saturation_period` (weeks).
+
+def _filter_data(venue_records: set[VenueRecord], context: ReportContext):
+    """Filters out undesirable venues. The current criteria is based on the
+    minimum number of RSVPs and ROR of `context` and whether a venue's zone
+    (or, if `context` has a saturation radius, any venue within it) has had
+    a seminar within the saturation period (weeks) of `context`.
     """
     
     # Zone codes are reused across markets - we need to check by both zone and market
     # E.g., there could be a G101 for both HOU and PDX
     saturated_zones = {
         (venue.market, venue.zone) for venue in venue_records 
-        if venue.jobs_within(relativedelta(weeks=saturation_period), start_date)
+        if context.is_saturating(venue)
     }
 
+    # With a saturation radius, venues near a saturating venue are excluded
+    # too, even if they are across a zone boundary from it
+    saturating_index = None
+    if context.params.saturation_radius > 0:
+        saturating_index = ProximityIndex(
+            (venue for venue in venue_records if context.is_saturating(venue)),
+            context.params.saturation_radius, context.centroids)
+
     # Filter by saturated zones and minimum rsvps
-    filtered_data = {
-        venue for venue in venue_records
-        if ((venue.market, venue.zone) not in saturated_zones
-            and venue.latest_job.rvsps >= min_rsvps
-            and venue.latest_job.ror >= min_ror)
-    }
+    filtered_data = set()
+    for venue in venue_records:
+        if (venue.market, venue.zone) in saturated_zones:
+            continue
+
+        if saturating_index is not None and next(saturating_index.within(venue), None) is not None:
+            continue
+
+        latest_job = context.latest_job(venue)
+        if (latest_job.rvsps >= context.params.min_rsvps
+            and latest_job.ror >= context.params.min_ror):
+            filtered_data.add(venue)
 
     return filtered_data
 
 
-def _sort_data(filtered_data: set[VenueRecord], start_date: datetime, end_date: datetime, prox_weeks: int) -> list[VenueRecord]:
+def _sort_data(filtered_data: set[VenueRecord], context: ReportContext) -> list[VenueRecord]:
     """Sorts venues first by whether they had a job around the same time last year,
     and then by ROR.
     """
@@ -341,38 +869,54 @@ def _sort_data(filtered_data: set[VenueRecord], start_date: datetime, end_date:
     proximal_venues = []
     nonproximal_venues = []
 
-    for venue in filtered_data:
-        if venue.around_time_last_year(start_date, end_date, prox_weeks):
+    # Venues are visited in key order so that venues with the same ROR are
+    # always ranked the same way, rather than in set iteration order (which
+    # varies between runs, as strings are hashed with a random seed).
+    for venue in sorted(filtered_data, key=lambda venue: venue.key):
+        if context.qualifying_session(venue):
             proximal_venues.append(venue)
         else:
             nonproximal_venues.append(venue)
 
     # Sort proximal venues by ROR
-    proximal_venues.sort(key=lambda v: v.latest_job.ror, reverse=True)
+    proximal_venues.sort(key=lambda v: context.latest_job(v).ror, reverse=True)
 
     # Sort non-proximal venues by ROR
-    nonproximal_venues.sort(key=lambda v: v.latest_job.ror, reverse=True)
+    nonproximal_venues.sort(key=lambda v: context.latest_job(v).ror, reverse=True)
 
     return proximal_venues + nonproximal_venues
 
 
-def _style_workbook(wb: openpyxl.Workbook):
+@cache
+def _cell_styles() -> tuple:
+    """Returns the `(header_font, alignment, border)` styles used by
+    `_style_workbook`. Built on first use and shared by every workbook.
+    """
+    from openpyxl.styles import Alignment, Border, Font, Side
+
+    header_font = Font(bold=True)
+    left_alignment = Alignment(horizontal="left", vertical="center", indent=0, wrap_text=True)
+    thin = Side(border_style="thin", color="000000")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    return (header_font, left_alignment, border)
+
+
+def _style_workbook(wb: 'openpyxl.Workbook'):
     """Add styles to the workbook.
     """
+    from openpyxl.utils import get_column_letter
+    header_font, left_alignment, border = _cell_styles()
 
     # Make headers bold and pinned (freeze top row)
     for ws in wb.worksheets:
         # Bold headers
         for cell in ws[1]:
-            cell.font = Font(bold=True)
+            cell.font = header_font
         # Freeze top row
         ws.freeze_panes = ws['A2']
 
     # Left justify, pad, and border cells
-    left_alignment = Alignment(horizontal="left", vertical="center", indent=0, wrap_text=True)
-    thin = Side(border_style="thin", color="000000")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
     for ws in wb.worksheets:
         col_maxlen = {}
         
@@ -394,7 +938,7 @@ def _style_workbook(wb: openpyxl.Workbook):
 
         # Set column widths based on data rows only
         for idx, maxlen in col_maxlen.items():
-            col_letter = openpyxl.utils.get_column_letter(idx)
+            col_letter = get_column_letter(idx)
             # Add padding and set a reasonable minimum width
             width = max(maxlen + 4, 8)  # Minimum width of 8
-            ws.column_dimensions[col_letter].width = width
+            ws.column_dimensions[col_letter].width = width
\ No newline at end of file